@@ -1,15 +1,133 @@
 import numpy as n
-import matplotlib.pyplot as plt
-import scipy.constants as c
 import datetime
 import stuffr
 import re
-import astropy.units as u
-from astroquery.jplsbdb import SBDB
+import json
+import os
+import time
+import urllib.parse
+import urllib.request
 
+import neo_cache
 import neo_cat
+from lazy_import import lazy_module
+
+plt=lazy_module("matplotlib.pyplot")
+c=lazy_module("scipy.constants")
+
+# orbital elements kept in the local element store.
+# a, q, ad in AU, angles in deg, tp in JD (TDB), per in days, n in deg/day
+element_names=["e","a","q","i","om","w","ma","tp","per","n","ad"]
+element_dtype=n.dtype([("name","U48")]+[(k,"f8") for k in element_names])
+
+sbdb_query_url="https://ssd-api.jpl.nasa.gov/sbdb_query.api"
+
+def normalize_designation(name):
+    """
+    Catalog name to the designation used as the key of the element store.
+    "(2019 EE1)" -> "2019 EE1", "66391 Moshup (1999 KW4)" -> "66391", "467317 (2000 QW7)" -> "467317"
+    """
+    name=str(name).strip()
+    # numbered object, optionally followed by a name and/or the provisional designation
+    m=re.match(r"^(\d+)(\s+[A-Z][a-z].*|\s+\(.*\))?$",name)
+    if m is not None:
+        return(m.group(1))
+    m=re.match(r"^\((.*)\)$",name)
+    if m is not None:
+        return(m.group(1).strip())
+    return(name)
+
+def sbdb_bulk_query(sb_group="neo",timeout=300):
+    """
+    Elements of all objects in a group with one SBDB query API request.
+    """
+    fields=["pdes"]+element_names
+    url="%s?%s"%(sbdb_query_url,urllib.parse.urlencode({"fields":",".join(fields),"sb-group":sb_group}))
+    with urllib.request.urlopen(url,timeout=timeout) as f:
+        d=json.load(f)
+    el=n.zeros(len(d["data"]),dtype=element_dtype)
+    el["name"]=[row[0] for row in d["data"]]
+    for k in element_names:
+        col=d["fields"].index(k)
+        el[k]=[n.nan if row[col] is None else float(row[col]) for row in d["data"]]
+    return(el)
+
+def sbdb_single_query(name):
+    """
+    Elements of one object (one SBDB request). Elements that SBDB does not give,
+    e.g., per, n and ad of hyperbolic orbits, are NaN.
+    """
+    elements=database_lookup(name)
+    el=n.zeros(1,dtype=element_dtype)
+    el["name"]=name
+    for k in element_names:
+        if k in elements and elements[k] is not None:
+            el[k]=float(getattr(elements[k],"value",elements[k]))
+        else:
+            el[k]=n.nan
+    return(el)
+
+def missing_elements(name):
+    """
+    Row of NaN elements, for an object that could not be looked up.
+    """
+    el=n.zeros(1,dtype=element_dtype)
+    el["name"]=name
+    for k in element_names:
+        el[k]=n.nan
+    return(el)
+
+def element_store_fname():
+    return(os.path.join(neo_cache.cache_dir("elements"),"elements.npy"))
+
+def populate_element_store(fetch=sbdb_bulk_query):
+    """
+    Fill the local element store in bulk (by default all NEOs in one request).
+    """
+    el=fetch()
+    el["name"]=[normalize_designation(x) for x in el["name"]]
+    el=n.sort(el,order="name")
+    neo_cache.atomic_save(element_store_fname(),el)
+    return(el)
+
+def lookup_elements(names,fetch=sbdb_single_query,populate=sbdb_bulk_query,max_age=None,refresh=False):
+    """
+    Orbital elements for a list of object names.
+
+    Elements are read from the local element store. The store is populated in bulk
+    on first use, and objects that are not in it are queried one by one and added.
+    Objects that fail to be looked up get NaN elements. These are stored as well, so
+    that they are not queried again until the store is repopulated.
+
+    max_age - repopulate the store if it is older than this (s). None to keep it forever.
+    refresh - repopulate the store now.
+
+    returns a record array with element_dtype, in the same order as names.
+    """
+    keys=[normalize_designation(x) for x in names]
+    fname=element_store_fname()
+    if os.path.exists(fname) and not refresh and (max_age is None or time.time()-os.path.getmtime(fname) < max_age):
+        store=n.load(fname)
+    else:
+        store=populate_element_store(fetch=populate)
+
+    idx=n.minimum(n.searchsorted(store["name"],keys),max(len(store)-1,0))
+    missing=sorted(set([k for k,i in zip(keys,idx) if len(store) == 0 or store["name"][i] != k]))
+    if len(missing) > 0:
+        rows=[store]
+        for k in missing:
+            try:
+                rows.append(fetch(k))
+            except Exception as e:
+                print("no elements for %s (%s)"%(k,e))
+                rows.append(missing_elements(k))
+        store=n.sort(n.concatenate(rows),order="name")
+        neo_cache.atomic_save(fname,store)
+        idx=n.searchsorted(store["name"],keys)
+    return(store[idx].view(n.recarray))
 
 def database_lookup(object_name):
+    from astroquery.jplsbdb import SBDB
     neo = SBDB.query(object_name)
     elements = neo['orbit']['elements']
     #vecto = [elements['e'], 
@@ -28,38 +146,17 @@ def database_lookup(object_name):
 
 
 if __name__ == "__main__":
-    neos=neo_cat.read_neos(fname="cneos_closeapproach_data_past.csv")
-    names = []
-    for n_e_o in neos:
-        names.append(n_e_o["name"])
-    element_vector = []
-    for name in names:
-
-        if name != "66391 Moshup (1999 KW4)":
-            element_vector.append(database_lookup(name.replace("(","").replace(")","")))
-        if name == "66391 Moshup (1999 KW4)":
-            name = "66391 Moshup"
-            element_vector.append(database_lookup(name.replace("(","").replace(")","")))
-    
-    eccentricity = []
-    semi_axis = []
-    inclination = []
-    peri_arg = []
+    neos=neo_cat.load_catalog(fname="cneos_closeapproach_data_past.csv")
+    elements=lookup_elements(neos.name)
 
     print("checkpoint")
 
-    for element in element_vector:
-        eccentricity.append(float(element['e']))
-        semi_axis.append(element['a'].to(u.m)/149597870700.0)
-        inclination.append(element['i'].to(u.rad))
-        peri_arg.append(element['w'].to(u.rad))
+    eccentricity = elements.e
+    semi_axis = elements.a
+    inclination = n.radians(elements.i)
+    peri_arg = n.radians(elements.w)
     print(eccentricity[1], type(eccentricity[1]))
 
-    eccentricity = n.array(eccentricity)
-    semi_axis = n.array(semi_axis)
-    inclination = n.array(inclination)
-    peri_arg = n.array(peri_arg)
-
     plt.rcParams.update({'font.size':16})
     plt.subplot(231)
     plt.plot(semi_axis, eccentricity, '.')
@@ -111,16 +208,8 @@ if __name__ == "__main__":
 
 
 
-    dates = []
-    for objec in neos:
-        dates.append(objec["ymd"])
-    print(dates[1])
-
-    months = []
-
     #number per month?
-    for dat in dates:
-        months.append(datetime.datetime.strptime(dat,'%Y-%b-%d').month)
+    months = list(neos.epoch.astype("datetime64[s]").astype("datetime64[M]").astype(int)%12+1)
     
     terrible_implementation = []
     for i in range(1,13):
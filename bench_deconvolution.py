@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+'''Compare dense matrix and FFT least-squares range estimation (stuffr).
+
+For each code length, measures the time to set up the estimator and the
+time to decode a block of code periods, and checks that both give the same
+range estimates.
+'''
+
+import numpy as n
+import time
+import stuffr
+
+def bench(clen=1000,Nranges=1000,n_periods=100,seed=0):
+    code=stuffr.create_pseudo_random_code(len=clen,seed=seed)
+    Nranges=min(Nranges,clen)
+    rng=n.random.RandomState(seed)
+    z=n.array(rng.randn(n_periods,clen)+1j*rng.randn(n_periods,clen),dtype=n.complex64)
+
+    t0=time.perf_counter()
+    r=stuffr.create_estimation_matrix(code=code,rmax=Nranges,cache=False)
+    t1=time.perf_counter()
+    x_mat=n.dot(z,n.transpose(r["B"]))
+    t2=time.perf_counter()
+    est=stuffr.create_fft_estimator(code,rmax=Nranges)
+    t3=time.perf_counter()
+    x_fft=stuffr.fft_deconvolve(z,est)
+    t4=time.perf_counter()
+    err=n.max(n.abs(x_mat-x_fft))/n.max(n.abs(x_mat))
+    return(t1-t0,(t2-t1)/n_periods,t3-t2,(t4-t3)/n_periods,err)
+
+if __name__ == "__main__":
+    print("    clen  Nranges | matrix setup  per period | fft setup  per period | rel. diff")
+    for clen in [1000,2000,5000,10000]:
+        for Nranges in [200,1000]:
+            s0,d0,s1,d1,err=bench(clen=clen,Nranges=Nranges)
+            print("%8d %8d | %10.3g s %9.3g s | %7.3g s %9.3g s | %1.1g"%(clen,min(Nranges,clen),s0,d0,s1,d1,err))
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+'''Import time of the compute modules.
+
+Each module is imported in a fresh interpreter, several times, and the
+median time is reported, both in total and on top of importing numpy
+(which all modules need). Modules that should only be loaded when a
+plotting or remote query function is called are listed if an import
+pulls them in. Exit status is 1 if a module is over budget.
+'''
+
+import numpy as n
+import subprocess
+import sys
+import os
+
+modules=["neo_snr","neo_cat","debris","scattering","stuffr","neo_horizons",
+         "neo_kepler","neo_schedule","neo_montecarlo","SBDBlookup","radar_comp"]
+
+heavy=["matplotlib","h5py","astroquery","astropy","scipy"]
+
+probe='''
+import sys,time
+t0=time.perf_counter()
+import numpy
+t1=time.perf_counter()
+import %s
+t2=time.perf_counter()
+print(t1-t0,t2-t1," ".join([k for k in %r if k in sys.modules]))
+'''
+
+def import_time(module,n_runs=5):
+    '''
+    median numpy import time and median module import time after numpy (s),
+    and the heavy modules loaded by the import
+    '''
+    here=os.path.dirname(os.path.abspath(__file__))
+    t_np=[]
+    t_mod=[]
+    for i in range(n_runs):
+        out=subprocess.run([sys.executable,"-c",probe%(module,heavy)],cwd=here,
+                           capture_output=True,text=True,check=True).stdout.split()
+        t_np.append(float(out[0]))
+        t_mod.append(float(out[1]))
+        loaded=out[2:]
+    return(n.median(t_np),n.median(t_mod),loaded)
+
+if __name__ == "__main__":
+    budget=float(sys.argv[1]) if len(sys.argv) > 1 else 0.1
+    print("module          numpy   module+numpy   module   heavy modules loaded")
+    ok=True
+    for m in modules:
+        t_np,t_mod,loaded=import_time(m)
+        passed=t_mod < budget and len(loaded) == 0
+        ok=ok and passed
+        print("%-14s %5.0f ms %9.0f ms %6.0f ms   %-22s %s"%(m,t_np*1e3,(t_np+t_mod)*1e3,t_mod*1e3," ".join(loaded),"ok" if passed else "FAIL"))
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+'''Benchmarks of the catalog, SNR, waveform error and signal processing hot paths.
+
+Each case prepares its inputs outside the timed region and returns the
+function to time. After one untimed run, the time is the best of several
+runs. Peak memory is measured in one extra run with tracemalloc (numpy
+allocations included), so tracing does not slow down the timed runs.
+
+Results are appended to a JSON history file. A case is flagged as a
+regression when its time or peak memory is more than the tolerance above
+the median of the last runs recorded on the same host. The exit status
+is 1 if there are regressions.
+
+python bench_suite.py             all cases, catalogs of 1k-1M rows
+python bench_suite.py -q          small sizes only
+python bench_suite.py -k lin_error   cases with lin_error in the name
+'''
+
+import numpy as n
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import neo_cat
+import neo_snr
+import neo_horizons
+import debris
+import stuffr
+
+months=["Jan","Feb","Mar","Apr","May","Jun","Jul","Aug","Sep","Oct","Nov","Dec"]
+
+def write_catalog(fname,n_rows,max_dist_ld=20.0,seed=0):
+    '''
+    Synthetic CNEOS close-approach CSV file with n_rows objects during 2023
+    '''
+    rng=n.random.RandomState(seed)
+    epoch=n.datetime64("2023-01-01T00:00","m")+rng.randint(0,365*24*60,size=n_rows)
+    dist=rng.uniform(0.05,max_dist_ld,size=n_rows)
+    v_rel=rng.uniform(2.0,30.0,size=n_rows)
+    H=rng.uniform(18.0,32.0,size=n_rows)
+    d_min=10.0**(3.1-0.2*H)
+    with open(fname,"w",encoding="utf-8") as f:
+        f.write('"Object","Close-Approach (CA) Date","CA Distance Nominal (LD | au)","CA Distance Minimum (LD | au)","V relative (km/s)","V infinity (km/s)","H (mag)","Estimated Diameter",""\n')
+        for i in range(n_rows):
+            e=epoch[i].item()
+            if d_min[i] < 1000.0:
+                diam="%1.0f m - %4.0f m"%(d_min[i],2.2*d_min[i])
+            else:
+                diam="%1.1f km - %4.1f km"%(d_min[i]/1e3,2.2*d_min[i]/1e3)
+            f.write('"(2023 B%d)","%d-%s-%02d %02d:%02d ± < 00:01","%1.2f | %1.5f","%1.2f | %1.5f","%1.2f","%1.2f","%1.1f","%s","b%07d"\n'%(
+                i,e.year,months[e.month-1],e.day,e.hour,e.minute,
+                dist[i],dist[i]*neo_snr.LD/1.495978707e11,
+                0.99*dist[i],0.99*dist[i]*neo_snr.LD/1.495978707e11,
+                v_rel[i],0.99*v_rel[i],H[i],diam,i))
+    return(fname)
+
+# cases. each setup function returns the function to time.
+
+def setup_read_neos(fname):
+    return(lambda: neo_cat.read_neos(fname))
+
+def setup_read_catalog(fname):
+    return(lambda: neo_cat.read_catalog(fname))
+
+def setup_detectability_scalar(n_obj):
+    r=neo_snr.e3d_radar()
+    rng=n.random.RandomState(0)
+    objs=[neo_snr.space_object(d,rm,spin_period_s=300.0) for d,rm in zip(rng.uniform(1,100,n_obj),rng.uniform(0.1,10,n_obj)*neo_snr.LD)]
+    return(lambda: [neo_snr.detectability(r,o) for o in objs])
+
+def setup_detectability_batch(n_obj):
+    r=neo_snr.e3d_radar()
+    rng=n.random.RandomState(0)
+    d=rng.uniform(1,100,n_obj)
+    rm=rng.uniform(0.1,10,n_obj)*neo_snr.LD
+    return(lambda: neo_snr.detectability_batch(r,d,rm,spin_period_s=300.0))
+
+def setup_catalog_check(fname,cache_root):
+    r=neo_snr.e3d_radar()
+    runs=[0]
+    def run():
+        # fresh cache for each run, so every candidate is fetched from the stand-in
+        runs[0]+=1
+        os.environ["NEO_CACHE_DIR"]=os.path.join(cache_root,"catalog_check%d"%(runs[0]))
+        with contextlib.redirect_stdout(io.StringIO()):
+            neo_snr.catalog_check(r,fname=fname,max_workers=4,query=neo_horizons.synthetic_query,min_interval=0.0)
+    return(run)
+
+def setup_lin_error(txlen,oversample,bw=1e6,n_ipp=10):
+    rng=n.random.RandomState(0)
+    return(lambda: debris.lin_error(enr=1.0,txlen=txlen,bw=bw,sr=oversample*bw,n_ipp=n_ipp,rng=rng))
+
+def setup_estimation_matrix(clen,rmax=1000):
+    code=stuffr.create_pseudo_random_code(len=clen,seed=0)
+    return(lambda: stuffr.create_estimation_matrix(code=code,rmax=rmax,cache=False))
+
+def setup_fft_estimator(clen,rmax=1000):
+    code=stuffr.create_pseudo_random_code(len=clen,seed=0)
+    return(lambda: stuffr.create_fft_estimator(code,rmax=rmax))
+
+def setup_spectrogram(n_samples,window=1024,overlap=512):
+    x=n.random.RandomState(0).randn(n_samples)
+    return(lambda: stuffr.spectrogram(x,window=window,overlap=overlap))
+
+def setup_decimator(fun,n_samples,**kwargs):
+    x=n.random.RandomState(0).randn(n_samples)
+    return(lambda: fun(x,**kwargs))
+
+def setup_decimate_mat(fun,shape,**kwargs):
+    M=n.random.RandomState(0).randn(*shape)
+    return(lambda: fun(M,**kwargs))
+
+def cases(tmpdir,quick=False):
+    '''
+    list of (name, setup) pairs
+    '''
+    sizes=[1000,10000] if quick else [1000,10000,100000,1000000]
+    c=[]
+    for s in sizes:
+        fname=os.path.join(tmpdir,"catalog_%d.csv"%(s))
+        c.append(("read_neos_%d"%(s),lambda fname=fname,s=s: setup_read_neos(fname if os.path.exists(fname) else write_catalog(fname,s))))
+        c.append(("read_catalog_%d"%(s),lambda fname=fname,s=s: setup_read_catalog(fname if os.path.exists(fname) else write_catalog(fname,s))))
+    for s in ([10000] if quick else [10000,100000]):
+        c.append(("detectability_scalar_%d"%(s),lambda s=s: setup_detectability_scalar(s)))
+    for s in ([10000,100000] if quick else [10000,100000,1000000]):
+        c.append(("detectability_batch_%d"%(s),lambda s=s: setup_detectability_batch(s)))
+    s=500 if quick else 2000
+    fname=os.path.join(tmpdir,"catalog_check_%d.csv"%(s))
+    c.append(("catalog_check_mock_%d"%(s),lambda fname=fname,s=s: setup_catalog_check(write_catalog(fname,s,max_dist_ld=0.2),tmpdir)))
+    for txlen in [100.0,1000.0]:
+        for oversample in ([10] if quick else [10,100]):
+            c.append(("lin_error_%dus_x%d"%(txlen,oversample),lambda txlen=txlen,oversample=oversample: setup_lin_error(txlen,oversample)))
+    for clen in ([1000,2000] if quick else [1000,5000,10000]):
+        c.append(("estimation_matrix_%d"%(clen),lambda clen=clen: setup_estimation_matrix(clen)))
+        c.append(("fft_estimator_%d"%(clen),lambda clen=clen: setup_fft_estimator(clen)))
+    N=2**20 if quick else 2**23
+    c.append(("spectrogram_%d"%(N),lambda: setup_spectrogram(N)))
+    c.append(("decimate_%d"%(N),lambda: setup_decimator(stuffr.decimate,N,dec=10)))
+    c.append(("decimate2_%d"%(N),lambda: setup_decimator(stuffr.decimate2,N,dec=10)))
+    c.append(("median_dec_%d"%(N),lambda: setup_decimator(stuffr.median_dec,N,dec=10)))
+    c.append(("decimate_max_%d"%(N),lambda: setup_decimator(stuffr.decimate_max,N,dec=10)))
+    shape=(1000,1000) if quick else (4000,4000)
+    c.append(("decimate_mat_%dx%d"%shape,lambda: setup_decimate_mat(stuffr.decimate_mat,shape,dec0=10,dec1=10)))
+    c.append(("decimate_mat_max_%dx%d"%shape,lambda: setup_decimate_mat(stuffr.decimate_mat_max,shape,dec0=10)))
+    return(c)
+
+def measure(fun,min_time=1.0,max_runs=20):
+    '''
+    best time (s) of runs until min_time has passed (at least two runs, at most max_runs),
+    and peak traced memory (bytes) of one more run. The first run (lazy imports, lookup
+    tables) is not timed.
+    '''
+    fun()
+    ts=[]
+    while len(ts) < 2 or (sum(ts) < min_time and len(ts) < max_runs):
+        t0=time.perf_counter()
+        fun()
+        ts.append(time.perf_counter()-t0)
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    fun()
+    peak=tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return(min(ts),peak,len(ts))
+
+def git_commit():
+    try:
+        return(subprocess.run(["git","rev-parse","--short","HEAD"],cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True,text=True,check=True).stdout.strip())
+    except Exception:
+        return(None)
+
+def read_history(fname):
+    if not os.path.exists(fname):
+        return([])
+    with open(fname,"r") as f:
+        return(json.load(f))
+
+def write_history(fname,history):
+    tmp="%s.tmp"%(fname)
+    with open(tmp,"w") as f:
+        json.dump(history,f,indent=1)
+    os.replace(tmp,fname)
+
+def baseline(history,host,name,key,n_last=5):
+    '''
+    median of the last n_last recorded values of a case on this host, or None
+    '''
+    vals=[h["results"][name][key] for h in history if h["host"] == host and name in h["results"]]
+    if len(vals) == 0:
+        return(None)
+    return(float(n.median(vals[-n_last:])))
+
+if __name__ == "__main__":
+    p=argparse.ArgumentParser(description="Benchmark suite")
+    p.add_argument("-q","--quick",action="store_true",help="small problem sizes only")
+    p.add_argument("-k",default="",help="run cases with this substring in the name")
+    p.add_argument("--history",default="bench_history.json",help="JSON history file")
+    p.add_argument("--tolerance",type=float,default=0.25,help="relative increase flagged as a regression")
+    p.add_argument("--no-save",action="store_true",help="do not append results to the history")
+    p.add_argument("--list",action="store_true",help="list cases and exit")
+    args=p.parse_args()
+
+    history=read_history(args.history)
+    host=platform.node()
+    results={}
+    regressions=[]
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cache_env=os.environ.get("NEO_CACHE_DIR")
+        os.environ["NEO_CACHE_DIR"]=os.path.join(tmpdir,"neo_cache")
+        todo=[(name,setup) for name,setup in cases(tmpdir,quick=args.quick) if args.k in name]
+        if args.list:
+            print("\n".join([name for name,setup in todo]))
+            sys.exit(0)
+        print("case                              time (s)   peak (MB)  runs   vs. baseline")
+        for name,setup in todo:
+            t,peak,n_runs=measure(setup())
+            results[name]={"time_s":t,"peak_mb":peak/1e6,"runs":n_runs}
+            flags=[]
+            for key,label in [("time_s","time"),("peak_mb","memory")]:
+                b=baseline(history,host,name,key)
+                if b is not None and b > 0 and results[name][key] > (1.0+args.tolerance)*b:
+                    flags.append("%s x%1.2f"%(label,results[name][key]/b))
+            b=baseline(history,host,name,"time_s")
+            ratio="" if b is None else "x%1.2f"%(t/b)
+            if len(flags) > 0:
+                regressions.append(name)
+                ratio+="  REGRESSION %s"%(", ".join(flags))
+            print("%-32s %9.3g %11.1f %5d   %s"%(name,t,peak/1e6,n_runs,ratio))
+            sys.stdout.flush()
+        if cache_env is None:
+            del os.environ["NEO_CACHE_DIR"]
+        else:
+            os.environ["NEO_CACHE_DIR"]=cache_env
+
+    if not args.no_save:
+        history.append({"date":datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+                        "commit":git_commit(),
+                        "host":host,
+                        "python":platform.python_version(),
+                        "numpy":n.__version__,
+                        "quick":args.quick,
+                        "results":results})
+        write_history(args.history,history)
+    if len(regressions) > 0:
+        print("%d regressions: %s"%(len(regressions)," ".join(regressions)))
+        sys.exit(1)
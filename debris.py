@@ -6,14 +6,22 @@ Range and range-rate error analysis
 '''
 
 import numpy as n
-import matplotlib.pyplot as plt
-import scipy.constants as c
-import scipy.stats as stats
-import scipy.special as special
-import scipy.signal as ss
-import scipy.interpolate as si
-import h5py
 import os
+import multiprocessing
+import fcntl
+import time
+
+import neo_cache
+import scattering
+from lazy_import import lazy_module
+
+# plotting, hdf5 and signal processing modules are imported when first used
+plt=lazy_module("matplotlib.pyplot")
+c=lazy_module("scipy.constants")
+ss=lazy_module("scipy.signal")
+si=lazy_module("scipy.interpolate")
+sf=lazy_module("scipy.fft")
+h5py=lazy_module("h5py")
 
 # do we pop-up plots for range and range-rate error sweeps
 show_plots=True
@@ -22,10 +30,11 @@ def hard_target_enr(gain_tx, gain_rx,
                     wavelength_m, power_tx,
                     range_tx_m, range_rx_m,
                     diameter_m=0.01, bandwidth=10,
-                    rx_noise_temp=150.0):
+                    rx_noise_temp=150.0,
+                    rcs_model="rayleigh_optical"):
     '''
     Deterine the energy-to-noise ratio for a hard target (signal-to-noise ratio).
-    Assume a smooth transition between Rayleigh and optical scattering.
+    By default, assume a smooth transition between Rayleigh and optical scattering.
 
     gain_tx - transmit antenna gain, linear
     gain_rx - receiver antenna gain, linear
@@ -36,19 +45,13 @@ def hard_target_enr(gain_tx, gain_rx,
     diameter_m - object diameter (meters)
     bandwidth - effective receiver noise bandwidth for incoherent integration (tx_len*n_ipp/sample_rate)
     rx_noise_temp - receiver noise temperature (K)
+    rcs_model - radar cross-section model (see scattering.models)
     (Markkanen et.al., 1999)
     '''
-    ##
-    ## Determine returned signal power, given diameter of sphere
-    ## Ignore Mie regime and use either optical or rayleigh scatter
-    ##
-    is_rayleigh = diameter_m < wavelength_m/(n.pi*n.sqrt(3.0))
-    is_optical = diameter_m >= wavelength_m/(n.pi*n.sqrt(3.0))
-    rayleigh_power = (9.0*power_tx*(((gain_tx*gain_rx)*(n.pi**2.0)*(diameter_m**6.0))/(256.0*(wavelength_m**2.0)*(range_rx_m**2.0*range_tx_m**2.0))))
-    optical_power = (power_tx*(((gain_tx*gain_rx)*(wavelength_m**2.0)*(diameter_m**2.0)))/(256.0*(n.pi**2)*(range_rx_m**2.0*range_tx_m**2.0)))
+    sigma=scattering.rcs(diameter_m,wavelength_m,model=rcs_model)
+    rx_power=power_tx*gain_tx*gain_rx*wavelength_m**2.0*sigma/((4.0*n.pi)**3.0*range_rx_m**2.0*range_tx_m**2.0)
     rx_noise = c.k*rx_noise_temp*bandwidth
-    return(((is_rayleigh)*rayleigh_power + (is_optical)*optical_power)/rx_noise)
-
+    return(rx_power/rx_noise)
 
 def target_diameter(gain_tx, gain_rx,
                     wavelength_m, power_tx,
@@ -61,15 +64,18 @@ def target_diameter(gain_tx, gain_rx,
      determine smallest sphere detactable with a certain ENR
      Ignore Mie regime and use either optical or Rayleigh scatter.
     (Markkanen et.al., 1999)
+
+     This is the closed form inverse of hard_target_enr with the rayleigh_optical
+     cross-section model. All arguments can be arrays, which are broadcast
+     against each other.
     '''
-    n_diam=1000
-    diams = 10**n.linspace(-4,3,num=n_diam)
-    diams[n_diam-1]=n.nan
-    enrs = hard_target_enr(gain_tx,gain_rx,wavelength_m,power_tx,range_tx_m,range_rx_m,diams,bandwidth,rx_noise_temp)
-    i=0
-    while enrs[i] < enr and i<n_diam:
-        i+=1
-    return(diams[i])
+    rx_noise = c.k*rx_noise_temp*bandwidth
+    k = power_tx*gain_tx*gain_rx/(256.0*(range_rx_m**2.0*range_tx_m**2.0)*rx_noise)
+    # enr = k*9*pi^2*d^6/lambda^2 (Rayleigh) or k*lambda^2*d^2/pi^2 (optical).
+    # the two branches meet at d=lambda/(pi*sqrt(3)), so enr is monotonic in d.
+    d_rayleigh = (enr*wavelength_m**2.0/(9.0*n.pi**2.0*k))**(1.0/6.0)
+    d_optical = n.pi*n.sqrt(enr/k)/wavelength_m
+    return(n.where(d_rayleigh < wavelength_m/(n.pi*n.sqrt(3.0)), d_rayleigh, d_optical))
 
 def simulate_echo(codes,t_vecs,bw=1e6,dop_Hz=0.0,range_m=1e3,plot=False,sr=5e6):
     '''
@@ -77,27 +83,59 @@ def simulate_echo(codes,t_vecs,bw=1e6,dop_Hz=0.0,range_m=1e3,plot=False,sr=5e6):
     Use windowing to simulate a continuous finite bandwidth signal.
     This is used for linearized error estimates of range and range-rate errors.
     '''
-
-    codelen=len(codes[0])
-    n_codes=len(codes)
-    tvec=n.zeros(codelen*n_codes)
-    z=n.zeros(codelen*n_codes,dtype=n.complex64)
-    for ci,code in enumerate(codes):
-        z[n.arange(codelen)+ci*codelen]=code
-        tvec[n.arange(codelen)+ci*codelen]=t_vecs[ci]
-    tvec_i=n.copy(tvec)
-    tvec_i[0]=tvec[0]-1e99
-    tvec_i[len(tvec)-1]=tvec[len(tvec)-1]+1e99        
-    zfun=si.interp1d(tvec_i,z,kind="linear")
+    z=n.concatenate(codes)
+    tvec=n.concatenate(t_vecs)
     dt = 2.0*range_m/c.c
 
-    z=zfun(tvec+dt)*n.exp(1j*n.pi*2.0*dop_Hz*tvec)
+    # linear interpolation, holding the end values outside the echo
+    z=(n.interp(tvec+dt,tvec,z.real)+1j*n.interp(tvec+dt,tvec,z.imag))*n.exp(1j*n.pi*2.0*dop_Hz*tvec)
     if plot:
         plt.plot(tvec,z.real)
         plt.show()
     return(z)
 
-def lin_error(enr=10.0,txlen=1000.0,n_ipp=10,ipp=20e-3,bw=1e6,dr=10.0,ddop=1.0,sr=100e6,plot=False):
+def prc_codes(n_ipp,n_bits,oversample,sr,ipp,rng=n.random,dtype=n.complex64):
+    '''
+    Oversampled and filtered pseudorandom binary phase codes, one row per IPP,
+    and the corresponding sample times. Each code is padded with oversample zeros
+    on both sides.
+    '''
+    wfun=ss.windows.hamming(oversample)
+    wfun=wfun/n.sum(wfun)
+    n_samples=n_bits*oversample+2*oversample
+    bits=n.sign(rng.randn(n_ipp,n_bits))
+    # binary phase codes are real valued until the end
+    zcode=n.zeros([n_ipp,n_samples])
+    zcode[:,oversample:(n_samples-oversample)]=n.repeat(bits,oversample,axis=1)
+    # filter signal so that phase transitions are not too sharp
+    zcode=n.array(ss.fftconvolve(zcode,wfun[None,:],mode="same",axes=1),dtype=dtype)
+    tcode=n.arange(n_samples)[None,:]/sr + n.arange(n_ipp)[:,None]*ipp
+    return(zcode,tcode)
+
+def fisher_information(zcode,tcode,sr,dtype=n.complex128):
+    '''
+    Fisher information matrix (unit noise variance) for range and Doppler shift
+    of an echo with known transmit codes zcode and sample times tcode (rows are IPPs).
+
+    The range derivative of the echo is the time derivative of the code, which is 
+    calculated from the code spectrum. The Doppler derivative is 2 pi i t z(t).
+    '''
+    zcode=n.asarray(zcode,dtype=dtype)
+    n_samples=zcode.shape[1]
+    # codes are zero padded, so extending them to a fast fft length does not change the result
+    n_fft=sf.next_fast_len(n_samples)
+    freqs=sf.fftfreq(n_fft,d=1.0/sr)
+    dz_dr=(2.0/c.c)*sf.ifft(2j*n.pi*freqs[None,:]*sf.fft(zcode,n=n_fft,axis=1),axis=1)[:,0:n_samples]
+    dz_df=2j*n.pi*tcode*zcode
+    J=n.zeros([2,2],dtype=dtype)
+    J[0,0]=n.sum(n.abs(dz_dr)**2.0)
+    J[1,1]=n.sum(n.abs(dz_df)**2.0)
+    J[0,1]=n.vdot(dz_dr,dz_df)
+    J[1,0]=n.conj(J[0,1])
+    return(J)
+
+def lin_error(enr=10.0,txlen=1000.0,n_ipp=10,ipp=20e-3,bw=1e6,dr=10.0,ddop=1.0,sr=100e6,plot=False,
+              method="fft",dtype=n.complex128,rng=n.random):
     '''
      Determine linearized errors for range and range-rate error
      for a psuedorandom binary phase coded radar transmit pulse
@@ -107,32 +145,28 @@ def lin_error(enr=10.0,txlen=1000.0,n_ipp=10,ipp=20e-3,bw=1e6,dr=10.0,ddop=1.0,s
      given ENR after coherent integration (pulse compression)
      txlen in microseconds.
 
-    Simulate a measurement and do a linearized error estimate.
-
+     method="fft" calculates the Fisher information directly from the code spectrum.
+     method="sim" simulates echoes shifted by dr and ddop and uses finite differences
+     (the reference implementation, also used when plot=True).
+     dtype sets the complex precision of the calculation.
     '''
-    codes=[]
-    t_vecs=[]    
     n_bits = int(bw*txlen/1e6)
     oversample=int(sr/bw)
-    wfun=ss.hamming(oversample)
-    wfun=wfun/n.sum(wfun)
-    for i in range(n_ipp):
-        bits=n.array(n.sign(n.random.randn(n_bits)),dtype=n.complex64)
-        zcode=n.zeros(n_bits*oversample+2*oversample,dtype=n.complex64)
-        for j in range(oversample):
-            zcode[n.arange(n_bits)*oversample+j+oversample]=bits
-        # filter signal so that phase transitions are not too sharp
-        zcode=n.convolve(wfun,zcode,mode="same")
-        codes.append(zcode)
-        tcode=n.arange(n_bits*oversample+2*oversample)/sr + float(i)*ipp
-        t_vecs.append(tcode)
-
-    z0=simulate_echo(codes,t_vecs,dop_Hz=0.0,range_m=0.0,bw=bw,sr=sr)
+    zcode,tcode=prc_codes(n_ipp,n_bits,oversample,sr,ipp,rng=rng,dtype=dtype)
     tau=(float(n_ipp)*txlen/1e6)
     
     # convert coherently integrated ENR to SNR (variance of the measurement errors at receiver bandwidth)
     snr = enr/(tau*sr)
 
+    if method == "fft" and not plot:
+        J=fisher_information(zcode,tcode,sr,dtype=dtype)
+        S=n.real(n.linalg.inv(J)/snr)
+        return(n.sqrt(n.diag(S)))
+
+    codes=list(zcode)
+    t_vecs=list(tcode)
+    z0=simulate_echo(codes,t_vecs,dop_Hz=0.0,range_m=0.0,bw=bw,sr=sr)
+
     if plot:
         plt.plot(z0.real)
         plt.plot(z0.imag)
@@ -156,7 +190,7 @@ def lin_error(enr=10.0,txlen=1000.0,n_ipp=10,ipp=20e-3,bw=1e6,dr=10.0,ddop=1.0,s
         plt.show()
 
     t_l=len(z_dr)
-    A=n.zeros([t_l,2],dtype=n.complex64)
+    A=n.zeros([t_l,2],dtype=dtype)
     A[:,0]=z_diff_r
     A[:,1]=z_diff_dop
     S=n.real(n.linalg.inv(n.dot(n.transpose(n.conj(A)),A))/snr)
@@ -171,37 +205,248 @@ def ionospheric_error_fun():
     efun=si.interp1d(r,e)
     return(efun)
 
+# version of the range and Doppler error model. tables computed with another
+# version are not reused.
+error_model_version=2
+
+def error_table_key(txlen,bw,ipp,n_ipp,n_interp):
+    return(neo_cache.param_key("lin_error",error_model_version,float(txlen),float(bw),float(ipp),int(n_ipp),int(n_interp)))
+
+def error_cache_fname():
+    return(os.path.join(neo_cache.cache_dir(),"error_tables.h5"))
+
+def compute_error_table(args):
+    '''
+    Range and Doppler error table for one waveform as a function of ENR.
+    The errors scale as 1/sqrt(ENR), so one linearized error estimate is enough.
+    The random code is seeded with the table key, so tables are reproducible.
+    '''
+    key,txlen,bw,ipp,n_ipp,n_interp=args
+    enrs=10.0**n.linspace(-3,10,num=n_interp)
+    dr,ddop=lin_error(enr=1.0,txlen=txlen,bw=bw,ipp=ipp,n_ipp=n_ipp,rng=n.random.RandomState(int(key[0:8],16)))
+    return(key,{"enrs":enrs,"drs":dr/n.sqrt(enrs),"ddops":ddop/n.sqrt(enrs),
+                "params":n.array([txlen,bw,ipp,n_ipp,n_interp],dtype=n.float64)})
+
+def read_error_tables(keys,fname=None):
+    '''
+    Tables found in the cache file, as a dict key -> table. The access time of each
+    table found is updated, for least-recently-used eviction (see write_error_tables).
+    '''
+    if fname is None:
+        fname=error_cache_fname()
+    tables={}
+    if not os.path.exists(fname):
+        return(tables)
+    with open(fname+".lock","w") as lock:
+        fcntl.flock(lock,fcntl.LOCK_EX)
+        t_now=time.time()
+        with h5py.File(fname,"r+") as h:
+            for k in keys:
+                if k in h:
+                    tables[k]=dict([(d,h[k][d][()]) for d in ["enrs","drs","ddops","params"]])
+                    h[k].attrs["accessed"]=t_now
+    return(tables)
+
+def write_error_tables(tables,fname=None,max_bytes=100e6,max_age=None):
+    '''
+    Add tables to the cache file. The least recently used tables are evicted until the
+    tables take less than max_bytes. If max_age is given, tables created more than
+    max_age seconds ago are evicted as well.
+
+    Tables are added to the file in place, and the space of evicted tables is reused.
+    Readers and writers hold an exclusive fcntl lock on fname.lock while the file is
+    open, so the cache file can only be shared between processes on Unix.
+    '''
+    if fname is None:
+        fname=error_cache_fname()
+    with open(fname+".lock","w") as lock:
+        fcntl.flock(lock,fcntl.LOCK_EX)
+        t_now=time.time()
+        if os.path.exists(fname):
+            h=h5py.File(fname,"r+")
+        else:
+            h=h5py.File(fname,"w",fs_strategy="fsm",fs_persist=True)
+        with h:
+            for k in tables.keys():
+                if k in h:
+                    del h[k]
+                g=h.create_group(k)
+                for d in tables[k].keys():
+                    g[d]=tables[k][d]
+                g.attrs["created"]=t_now
+                g.attrs["accessed"]=t_now
+                g.attrs["version"]=error_model_version
+            entries=[]
+            for k in h.keys():
+                created=h[k].attrs["created"]
+                accessed=h[k].attrs.get("accessed",created)
+                size=sum([h[k][d].nbytes for d in h[k].keys()])
+                entries.append((accessed,k,created,size))
+            # most recently used first
+            n_bytes=0
+            for accessed,k,created,size in sorted(entries,reverse=True):
+                if (max_age is not None and t_now-created > max_age) or n_bytes+size > max_bytes:
+                    del h[k]
+                    continue
+                n_bytes+=size
+
+def precalculate_dr_many(waveforms,n_interp=20,n_proc=None,fname=None):
+    '''
+    Error tables for many waveforms, given as a list of (txlen,bw,ipp,n_ipp).
+    Tables that are not in the cache are computed in parallel and added to it.
+
+    returns a list of tables (dicts with enrs, drs and ddops) in the same order
+    '''
+    keys=[error_table_key(txlen,bw,ipp,n_ipp,n_interp) for txlen,bw,ipp,n_ipp in waveforms]
+    tables=read_error_tables(keys,fname=fname)
+    todo={}
+    for k,(txlen,bw,ipp,n_ipp) in zip(keys,waveforms):
+        if k not in tables:
+            todo[k]=(k,txlen,bw,ipp,int(n_ipp),n_interp)
+    if len(todo) > 0:
+        if len(todo) == 1 or n_proc == 1:
+            new=dict(map(compute_error_table,todo.values()))
+        else:
+            pool=multiprocessing.Pool(n_proc)
+            try:
+                new=dict(pool.map(compute_error_table,todo.values()))
+            finally:
+                pool.terminate()
+        write_error_tables(new,fname=fname)
+        tables.update(new)
+    return([tables[k] for k in keys])
+
 # doppler error
 def precalculate_dr(txlen,bw,ipp=20e-3,n_ipp=20,n_interp=20):
-    if os.path.exists("cache_error.h5"):
-        h=h5py.File("cache_error.h5","r")
-        enrs=n.copy(h["enrs"].value)
-        drs=n.copy(h["drs"].value)
-        ddops=n.copy(h["ddops"].value)
-        h.close()
-    else:
-        enrs=10.0**n.linspace(-3,10,num=n_interp)
-        drs=n.zeros(n_interp)
-        ddops=n.zeros(n_interp)    
-        for ei,s in enumerate(enrs):
-            dr,ddop=lin_error(enr=s,txlen=txlen,bw=bw,ipp=ipp,n_ipp=n_ipp)
-            print("enr %1.2f dr %1.2f ddop %1.2f"%(s,dr,ddop))
-            drs[ei]=dr
-            ddops[ei]=ddop        
-
-        
-    rfun=si.interp1d(n.log10(enrs),n.log10(drs))
-    dopfun=si.interp1d(n.log10(enrs),n.log10(ddops))
-
-    if not os.path.exists("cache_error.h5"):
-        ho=h5py.File("cache_error.h5","w")
-        ho["enrs"]=enrs
-        ho["drs"]=drs
-        ho["ddops"]=ddops        
-        ho.close()
+    '''
+    Interpolation functions for log10 of range and Doppler error, as a function of log10(ENR),
+    for a given waveform. Tables are cached (see precalculate_dr_many).
+    '''
+    tab=precalculate_dr_many([(txlen,bw,ipp,n_ipp)],n_interp=n_interp)[0]
+    rfun=si.interp1d(n.log10(tab["enrs"]),n.log10(tab["drs"]))
+    dopfun=si.interp1d(n.log10(tab["enrs"]),n.log10(tab["ddops"]))
     return(rfun,dopfun)
 
 
+def sweep_point(args):
+    '''
+    Evaluate one waveform of a sweep (used by run_sweep worker processes).
+    '''
+    idx,txlen,bw,n_ipp,ipp,seed=args
+    dr,ddop=lin_error(enr=1.0,txlen=txlen,bw=bw,n_ipp=int(n_ipp),ipp=ipp,rng=n.random.RandomState(seed))
+    return(idx,dr,ddop)
+
+def run_sweep(fname="sweep.h5",
+              txlen=n.array([1000.0]),
+              bw=n.array([1e6]),
+              n_ipp=n.array([10]),
+              ipp=n.array([20e-3]),
+              enr=n.array([100.0]),
+              seed=0,
+              n_proc=None):
+    '''
+    Range and Doppler errors (lin_error) over the grid txlen x bw x n_ipp x ipp x enr.
+
+    Waveforms are evaluated in a pool of n_proc processes. The random code of each
+    waveform is seeded with seed plus its index in the grid, so results do not depend
+    on the number of processes or evaluation order.
+
+    Results are written to the hdf5 file fname as they complete. If the file exists
+    and contains the same grid, only the missing waveforms are evaluated, so an
+    interrupted sweep can be resumed by calling run_sweep again.
+
+    The errors scale as 1/sqrt(ENR), so each waveform is evaluated once
+    and the ENR axis is filled in by scaling.
+
+    returns a dict with the axes and the drs and ddops arrays (shape of the grid)
+    '''
+    axes={"txlen":n.atleast_1d(n.array(txlen,dtype=n.float64)),
+          "bw":n.atleast_1d(n.array(bw,dtype=n.float64)),
+          "n_ipp":n.atleast_1d(n.array(n_ipp,dtype=n.float64)),
+          "ipp":n.atleast_1d(n.array(ipp,dtype=n.float64)),
+          "enr":n.atleast_1d(n.array(enr,dtype=n.float64))}
+    wf_shape=(len(axes["txlen"]),len(axes["bw"]),len(axes["n_ipp"]),len(axes["ipp"]))
+    
+    h=h5py.File(fname,"a")
+    if "done" in h:
+        for k in axes.keys():
+            if not n.array_equal(h[k][()],axes[k]):
+                h.close()
+                raise ValueError("%s contains a sweep with a different %s axis"%(fname,k))
+        if h.attrs["seed"] != seed:
+            h.close()
+            raise ValueError("%s contains a sweep with a different seed"%(fname))
+    else:
+        for k in axes.keys():
+            h[k]=axes[k]
+        h.attrs["seed"]=seed
+        h.create_dataset("dr1",data=n.full(wf_shape,n.nan))
+        h.create_dataset("ddop1",data=n.full(wf_shape,n.nan))
+        h.create_dataset("done",data=n.zeros(wf_shape,dtype=bool))
+
+    done=h["done"][()]
+    todo=[]
+    for idx in zip(*n.where(~done)):
+        flat=n.ravel_multi_index(idx,wf_shape)
+        todo.append((idx,axes["txlen"][idx[0]],axes["bw"][idx[1]],axes["n_ipp"][idx[2]],axes["ipp"][idx[3]],seed+flat))
+
+    if len(todo) > 0:
+        pool=multiprocessing.Pool(n_proc)
+        try:
+            for idx,dr,ddop in pool.imap_unordered(sweep_point,todo):
+                h["dr1"][idx]=dr
+                h["ddop1"][idx]=ddop
+                h["done"][idx]=True
+                h.flush()
+        finally:
+            pool.terminate()
+    dr1=h["dr1"][()]
+    ddop1=h["ddop1"][()]
+    h.close()
+
+    scale=1.0/n.sqrt(axes["enr"])
+    axes["drs"]=dr1[...,None]*scale
+    axes["ddops"]=ddop1[...,None]*scale
+    return(axes)
+
+def load_sweep(fname="sweep.h5"):
+    '''
+    Read the results of run_sweep from file, without evaluating missing points (NaN).
+    '''
+    h=h5py.File(fname,"r")
+    res={}
+    for k in ["txlen","bw","n_ipp","ipp","enr"]:
+        res[k]=h[k][()]
+    scale=1.0/n.sqrt(res["enr"])
+    res["drs"]=h["dr1"][()][...,None]*scale
+    res["ddops"]=h["ddop1"][()][...,None]*scale
+    h.close()
+    return(res)
+
+def plot_sweep(res,x="bw",idx={}):
+    '''
+    Plot range and Doppler errors of a sweep as a function of one axis (x).
+    The other axes are fixed to the index given in idx (default first element).
+    '''
+    names=["txlen","bw","n_ipp","ipp","enr"]
+    sl=tuple([slice(None) if k == x else idx.get(k,0) for k in names])
+    plt.subplot(121)
+    plt.loglog(res[x],res["drs"][sl])
+    plt.xlabel(x)
+    plt.ylabel("Range error standard deviation (m)")
+    plt.grid()
+    plt.subplot(122)
+    plt.loglog(res[x],res["ddops"][sl])
+    plt.xlabel(x)
+    plt.ylabel("Doppler error standard deviation (Hz)")
+    plt.grid()
+    plt.tight_layout()
+    if show_plots:
+        plt.show()
+    else:
+        plt.clf()
+        plt.close()
+
 def debug_debris_filter():
     '''
     Debug plot 
@@ -210,11 +455,8 @@ def debug_debris_filter():
     '''
     n_r=1000
     ranges = n.linspace(300e3,2000e3,num=n_r)
-    filter_diams=n.zeros(n_r)
-    diams=n.zeros(n_r)    
-    for ri,r in enumerate(ranges):
-        filter_diams[ri] = target_diameter(10**4.3, 10**2.263, 230e6/c.c, 5e6, ranges[ri], ranges[ri], enr=100.0, bandwidth=500.0, rx_noise_temp=150.0)
-        diams[ri] = target_diameter(10**4.3, 10**4.3, 230e6/c.c, 5e6, ranges[ri], ranges[ri], enr=25.0, bandwidth=45.0, rx_noise_temp=150.0)
+    filter_diams = target_diameter(10**4.3, 10**2.263, 230e6/c.c, 5e6, ranges, ranges, enr=100.0, bandwidth=500.0, rx_noise_temp=150.0)
+    diams = target_diameter(10**4.3, 10**4.3, 230e6/c.c, 5e6, ranges, ranges, enr=25.0, bandwidth=45.0, rx_noise_temp=150.0)
     plt.loglog(ranges/1e3,filter_diams,label="Filtered objects")
     plt.loglog(ranges/1e3,diams,label="Detectable objects")
     plt.xlabel("Range (km)")
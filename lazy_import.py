@@ -0,0 +1,23 @@
+#!/usr/bin/env python
+'''Deferred imports of heavy dependencies.
+
+plt=lazy_module("matplotlib.pyplot") can be used like the module itself,
+but the import only happens when an attribute is first accessed, so
+modules that only plot or query remote services in some functions can
+be imported quickly.
+'''
+
+import importlib
+
+class lazy_module:
+    def __init__(self,name):
+        self._name=name
+        self._module=None
+
+    def __getattr__(self,k):
+        if self._module is None:
+            self._module=importlib.import_module(self._name)
+        return(getattr(self._module,k))
+
+    def __repr__(self):
+        return("<lazy module %s>"%(self._name))
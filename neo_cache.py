@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+'''On-disk cache helpers shared by the catalog, ephemeris and error table caches.
+
+Cache files go in the directory given by the NEO_CACHE_DIR environment
+variable, or ./neo_cache by default. Functions that take a cache_dir
+argument use that directory instead.
+'''
+
+import numpy as n
+import hashlib
+import os
+import tempfile
+
+def cache_dir(subdir="",root=None):
+    if root is None:
+        root=os.environ.get("NEO_CACHE_DIR","neo_cache")
+    d=os.path.join(root,subdir)
+    os.makedirs(d,exist_ok=True)
+    return(d)
+
+def file_key(fname):
+    '''
+    Hash of file path, size and modification time. Changes when the file is edited or replaced,
+    and does not read the file.
+    '''
+    st=os.stat(fname)
+    return(param_key(os.path.abspath(fname),st.st_size,st.st_mtime_ns))
+
+def param_key(*args):
+    '''
+    Hash of a list of parameters, e.g., an object name and observer location.
+    '''
+    return(hashlib.sha1(repr(args).encode()).hexdigest()[0:16])
+
+def atomic_save(fname,a):
+    '''
+    Save array into a .npy file. Readers will either see the old file or the complete new one.
+    '''
+    fd,tmp=tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(fname)),suffix=".tmp")
+    try:
+        with os.fdopen(fd,"wb") as f:
+            n.save(f,a)
+        os.replace(tmp,fname)
+    except:
+        os.remove(tmp)
+        raise
@@ -1,14 +1,103 @@
 #!/usr/bin/env python
 
 import numpy as n
-import matplotlib.pyplot as plt
+import csv
+import itertools
+import glob
+import os
 
+import neo_cache
 
-def read_neos(fname="cneos_closeapproach_data.csv"):
+# columns of the CNEOS close-approach table
+# epoch is unix seconds (UTC) of the nominal close approach time
+catalog_dtype=n.dtype([("name","U48"),
+                       ("epoch","i8"),
+                       ("dist_ld","f8"),
+                       ("dist_min_ld","f8"),
+                       ("v_rel","f8"),
+                       ("v_inf","f8"),
+                       ("H","f8"),
+                       ("d_min","f8"),
+                       ("d_max","f8")])
+
+months={"Jan":"01","Feb":"02","Mar":"03","Apr":"04","May":"05","Jun":"06",
+        "Jul":"07","Aug":"08","Sep":"09","Oct":"10","Nov":"11","Dec":"12"}
+
+diam_units={"m":1.0,"km":1e3}
+
+def parse_rows(rows):
+    """
+    Convert a list of split CSV rows into a record array with catalog_dtype.
+    """
+    cat=n.zeros(len(rows),dtype=catalog_dtype)
+    if len(rows) == 0:
+        return(cat)
+    cat["name"]=[l[0] for l in rows]
+    # "2019-Mar-12 00:34 ± < 00:01" -> "2019-03-12T00:34"
+    dates=["%s%s%sT%s"%(l[1][0:5],months[l[1][5:8]],l[1][8:11],l[1][12:17]) for l in rows]
+    cat["epoch"]=n.array(dates,dtype="datetime64[m]").astype("datetime64[s]").astype(n.int64)
+    cat["dist_ld"]=[l[2].split("|")[0] for l in rows]
+    cat["dist_min_ld"]=[l[3].split("|")[0] for l in rows]
+    cat["v_rel"]=[l[4] for l in rows]
+    cat["v_inf"]=[l[5] for l in rows]
+    cat["H"]=[l[6] for l in rows]
+    # "16 m -   36 m" or "1.3 km -  2.8 km"
+    diams=[l[7].split() for l in rows]
+    cat["d_min"]=[float(d[0])*diam_units[d[1]] for d in diams]
+    cat["d_max"]=[float(d[3])*diam_units[d[4]] for d in diams]
+    return(cat)
+
+def read_catalog(fname="cneos_closeapproach_data.csv",row_filter=None,chunk_size=65536):
+    """
+    Read a CNEOS close-approach CSV file into a numpy record array (see catalog_dtype).
+    Columns can be accessed as arrays, e.g., cat.dist_ld or cat["d_max"].
 
+    row_filter - optional function, which is given a record array of parsed rows and
+                 returns a boolean mask of the rows to keep. It is applied to
+                 chunk_size rows at a time while parsing, so rejected rows are
+                 never accumulated.
+                 e.g., row_filter=lambda c: c.dist_ld < 5.0
+    """
+    chunks=[]
+    with open(fname,"r",encoding="utf-8") as f:
+        reader=csv.reader(f)
+        while True:
+            rows=[l for l in itertools.islice(reader,chunk_size) if len(l) > 7 and l[0] != "Object"]
+            if len(rows) == 0:
+                break
+            cat=parse_rows(rows)
+            if row_filter is not None:
+                cat=cat[row_filter(cat.view(n.recarray))]
+            chunks.append(cat)
+    if len(chunks) == 0:
+        return(n.zeros(0,dtype=catalog_dtype).view(n.recarray))
+    return(n.concatenate(chunks).view(n.recarray))
+
+def load_catalog(fname="cneos_closeapproach_data.csv"):
+    """
+    Same as read_catalog, but the parsed catalog is stored in a binary .npy file in the
+    cache directory, keyed by hash and modification time of the CSV file.
+    Later calls memory map the binary file, so startup is fast and several processes
+    reading the same catalog share the same pages.
+    """
+    prefix=os.path.join(neo_cache.cache_dir("catalog"),
+                        "%s-%s"%(os.path.basename(fname),neo_cache.param_key(os.path.abspath(fname))))
+    cname="%s-%s.npy"%(prefix,neo_cache.file_key(fname))
+    if not os.path.exists(cname):
+        neo_cache.atomic_save(cname,read_catalog(fname))
+        # remove tables of older versions of the same file
+        for old in glob.glob("%s-*.npy"%(prefix)):
+            if old != cname and os.path.exists(old):
+                os.remove(old)
+    return(n.load(cname,mmap_mode="r").view(n.recarray))
+
+def read_neos(fname="cneos_closeapproach_data.csv"):
+    """
+    List of dicts version of the catalog. Use read_catalog for anything large.
+    """
     n_list=[]
-    
-    f=file(fname,"r")
+
+    f=open(fname,"r",encoding="utf-8")
     for l in f.readlines():
         l=l.split(",")
         name=l[0].strip("\"")
@@ -31,11 +120,12 @@ def read_neos(fname="cneos_closeapproach_data.csv"):
         d_max=float(diam[n_par-2])
 #        print("%s %1.2f %1.2f-%1.2f"%(name,dist_ld,d_min,d_max))
         n_list.append({"name":name,"date":date,"d_min":d_min,"d_max":d_max,"dist_ld":dist_ld,"ymd":ymd,"hour":hour})
+    f.close()
     return(n_list)
 
 
 
 if __name__ == "__main__":
-    neos=read_neos()
+    neos=load_catalog()
     print(len(neos))
-    
+
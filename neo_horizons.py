@@ -1,9 +1,108 @@
 #!/usr/bin/env python
 
 import numpy as n
-import scipy.constants as c
-from astroquery.jplhorizons import Horizons
-import neo_snr
+import glob
+import os
+import re
+import threading
+import time
+import concurrent.futures
+import functools
+import neo_cache
+from lazy_import import lazy_module
+
+c=lazy_module("scipy.constants")
+
+# observer table quantities: 4 = azimuth and elevation, 20 = range and range-rate
+quantities="4,20"
+
+# one row of the ephemeris cache. t is unix seconds (UTC), range in m, range-rate in m/s
+ephemeris_dtype=n.dtype([("t","i8"),
+                         ("date","U24"),
+                         ("az","f8"),
+                         ("el","f8"),
+                         ("range","f8"),
+                         ("range_rate","f8")])
+
+def step_seconds(step):
+    """
+    Horizons step size string ("5m", "10 min", "1h", "2 hours", "1d") in seconds.
+    Month and year steps do not have a fixed length and are not supported.
+    """
+    m=re.match(r"^\s*(\d+)\s*(m|mins?|minutes?|h|hours?|d|days?)\s*$",step)
+    if m is None:
+        raise ValueError("unsupported step size %s"%(step))
+    return(int(m.group(1))*{"m":60,"h":3600,"d":86400}[m.group(2)[0]])
+
+def date2unix(date):
+    """
+    "2020-01-01" or "2020-01-01 12:00" to unix seconds
+    """
+    return(int(n.datetime64(date.strip().replace(" ","T"),"s").astype(n.int64)))
+
+def horizons_query(obj_id,location,start,stop,step,id_type):
+    """
+    Query Horizons for an observer table. Returns an array with ephemeris_dtype
+    containing all rows (no elevation cut).
+    """
+    from astroquery.jplhorizons import Horizons
+    obj = Horizons(id=obj_id,
+                   location=location,
+                   epochs={"start":start,
+                           "stop":stop,
+                           "step":step},id_type=id_type)
+    t=obj.ephemerides(quantities=quantities,get_raw_response=False)
+    e=n.zeros(len(t),dtype=ephemeris_dtype)
+    e["t"]=n.round((n.array(t["datetime_jd"])-2440587.5)*86400.0)
+    e["date"]=n.array(t["datetime_str"],dtype=str)
+    e["az"]=t["AZ"]
+    e["el"]=t["EL"]
+    e["range"]=n.array(t["delta"])*c.au
+    e["range_rate"]=n.array(t["delta_rate"])*1e3
+    return(e)
+
+def ephemeris(obj_id="2020 DA4",
+              obs_lat=69.3908,
+              obs_lon=20.2673,
+              obs_el=0.0,
+              start="2020-01-01",
+              stop="2020-06-01",
+              step="2h",
+              id_type="smallbody",
+              query=horizons_query,
+              cache_dir=None):
+    """
+    Observer table of an object, using a local cache.
+
+    The cache is keyed on object id, observer location and quantities. Each query is
+    stored as one binary file covering start-stop with the given step. A request is
+    answered from the cache if a stored table covers the time window with a step size
+    that divides the requested step, so a cached 5 minute table also serves hourly requests.
+
+    query - function used to fetch missing tables, by default a Horizons query.
+            replace with a local stand-in for testing.
+    cache_dir - cache directory, NEO_CACHE_DIR by default (see neo_cache).
+    """
+    location={'lon': obs_lon, 'lat': obs_lat, 'elevation': obs_el}
+    key=neo_cache.param_key(str(obj_id),float(obs_lat),float(obs_lon),float(obs_el),id_type,quantities)
+    cdir=neo_cache.cache_dir(os.path.join("ephemeris",key),root=cache_dir)
+
+    t0=date2unix(start)
+    t1=date2unix(stop)
+    dt=step_seconds(step)
+    want=n.arange(t0,t1+1,dt,dtype=n.int64)
+
+    for fname in glob.glob(os.path.join(cdir,"*.npy")):
+        c_t0,c_t1,c_dt=[int(x) for x in os.path.basename(fname)[:-4].split("_")]
+        if c_t0 <= t0 and c_t1 >= t1 and dt%c_dt == 0 and (t0-c_t0)%c_dt == 0:
+            e=n.load(fname)
+            idx=n.minimum(n.searchsorted(e["t"],want),len(e)-1)
+            if len(e) > 0 and n.all(e["t"][idx] == want):
+                return(e[idx])
+
+    e=query(obj_id,location,start,stop,step,id_type)
+    neo_cache.atomic_save(os.path.join(cdir,"%d_%d_%d.npy"%(t0,t1,dt)),e)
+    return(e)
 
 def check_detectability(obj_id="2020 DA4",
                         obs_lat=69.3908,
@@ -14,40 +113,129 @@ def check_detectability(obj_id="2020 DA4",
                         step="2h",
                         min_el=30.0,
                         id_type="smallbody",
+                        query=horizons_query,
+                        cache_dir=None,
                         debug=False):
-    
-    e3d = {'lon': obs_lon, 'lat': obs_lat, 'elevation': obs_el}
-    obj = Horizons(id=obj_id,
-                   location=e3d,
-                   epochs={"start":start,
-                           "stop":stop,
-                           "step":step},id_type=id_type)
-
-#    t0=obj.ephemerides(quantities="4,20",get_raw_response=True)
-    
-    t=obj.ephemerides(quantities="4,20",get_raw_response=False)
+    """
+    Range (m), range-rate (m/s), elevation (deg) and date strings of
+    ephemeris points above min_el. The ephemeris is cached (see ephemeris).
+    """
+    e=ephemeris(obj_id=obj_id,
+                obs_lat=obs_lat,
+                obs_lon=obs_lon,
+                obs_el=obs_el,
+                start=start,
+                stop=stop,
+                step=step,
+                id_type=id_type,
+                query=query,
+                cache_dir=cache_dir)
     if debug:
-        print(t)
-    els=[]
-    ranges=[]
-    range_rates=[]
-    dates=[]
-    for r in t:
-
-        name=r[0]
-        date=r[1]
-        az=r[7]   # deg 
-        el=r[8]   # deg
-        
-        if el > min_el:
-            delta=r[9]*c.au   # m
-            delta_rate=r[10]*1e3  #m/s
-            #            print("el %1.2f range %1.2g range-rate %1.2f gain %1.2f"%(el,delta,delta_rate/1e3,g_dB))
-            els.append(float(el))
-            ranges.append(delta)
-            range_rates.append(delta_rate)
-            dates.append(r[1])
-    return(n.array(ranges),n.array(range_rates),n.array(els),dates)
+        for r in e:
+            print("%s az %1.2f el %1.2f range %1.4g range-rate %1.2f"%(r["date"],r["az"],r["el"],r["range"],r["range_rate"]))
+    e=e[e["el"] > min_el]
+    return(n.copy(e["range"]),n.copy(e["range_rate"]),n.copy(e["el"]),list(e["date"]))
+
+class rate_limited_query:
+    """
+    Wrap a query function so that at most one request is started every min_interval
+    seconds (over all threads), and failed requests are retried with exponential backoff.
+    """
+    def __init__(self,query=horizons_query,min_interval=0.2,retries=3,backoff=2.0):
+        self.query=query
+        self.min_interval=min_interval
+        self.retries=retries
+        self.backoff=backoff
+        self.lock=threading.Lock()
+        self.t_next=0.0
+
+    def wait(self):
+        with self.lock:
+            t_now=time.time()
+            t_start=max(t_now,self.t_next)
+            self.t_next=t_start+self.min_interval
+        time.sleep(t_start-t_now)
+
+    def __call__(self,*args):
+        for i in range(self.retries+1):
+            self.wait()
+            try:
+                return(self.query(*args))
+            except Exception:
+                if i == self.retries:
+                    raise
+                time.sleep(self.backoff*2**i)
+
+def fetch_many(windows,
+               step="5m",
+               max_workers=8,
+               min_interval=0.2,
+               retries=3,
+               backoff=2.0,
+               query=horizons_query,
+               **kwargs):
+    """
+    Run check_detectability for many objects concurrently.
+
+    windows - list of (key, obj_id, start, stop)
+    kwargs - passed on to check_detectability (observer location, min_el, ...)
+
+    Generator, which yields (key, (ranges, range_rates, els, dates)) as requests complete,
+    so the order is not that of windows. Use key to put results back in order.
+    Cached ephemerides are returned without a remote request.
+    """
+    q=rate_limited_query(query,min_interval=min_interval,retries=retries,backoff=backoff)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as ex:
+        futures={}
+        for key,obj_id,start,stop in windows:
+            futures[ex.submit(check_detectability,obj_id=obj_id,start=start,stop=stop,step=step,query=q,**kwargs)]=key
+        for f in concurrent.futures.as_completed(futures):
+            yield(futures[f],f.result())
+
+def synthetic_query(obj_id,location,start,stop,step,id_type,delay=0.0):
+    """
+    Stand-in for horizons_query, for testing without network access. A straight line pass
+    with closest approach in the middle of the time window and a daily elevation cycle,
+    deterministic for each object. Each request takes a random time of up to delay seconds,
+    so that concurrent requests complete out of order.
+    """
+    t=n.arange(date2unix(start),date2unix(stop)+1,step_seconds(step),dtype=n.int64)
+    rng=n.random.RandomState(int(neo_cache.param_key(obj_id)[0:8],16))
+    tc=0.5*(t[0]+t[-1])
+    r0=rng.uniform(0.02,1.0)*384400e3
+    v=rng.uniform(2e3,30e3)
+    phase=2.0*n.pi*(t-tc)/86164.1+rng.uniform(0,2*n.pi)
+    e=n.zeros(len(t),dtype=ephemeris_dtype)
+    e["t"]=t
+    e["date"]=[time.strftime("%Y-%b-%d %H:%M",time.gmtime(x)) for x in t]
+    e["az"]=n.mod(180.0*phase/n.pi,360.0)
+    e["el"]=rng.uniform(-20.0,40.0)+40.0*n.sin(phase)
+    e["range"]=n.sqrt(r0**2.0+(v*(t-tc))**2.0)
+    e["range_rate"]=v**2.0*(t-tc)/e["range"]
+    time.sleep(delay*rng.random_sample())
+    return(e)
+
+def check_fetch_many(n_obj=20,max_workers=8,delay=0.05):
+    """
+    Fetch synthetic ephemerides of n_obj objects concurrently and one at a time, into separate
+    empty caches, and check that both give the same result for each object.
+    """
+    import tempfile
+    windows=[(i,"2020 X%d"%(i),"2020-01-01","2020-01-03") for i in range(n_obj)]
+    query=functools.partial(synthetic_query,delay=delay)
+    res=[]
+    for w in [max_workers,1]:
+        with tempfile.TemporaryDirectory() as d:
+            res.append(dict(fetch_many(windows,step="1h",max_workers=w,min_interval=0.0,query=query,cache_dir=d)))
+    assert sorted(res[0].keys()) == [w[0] for w in windows]
+    assert sorted(res[1].keys()) == [w[0] for w in windows]
+    for k in res[0]:
+        r0=res[0][k]
+        r1=res[1][k]
+        for a,b in zip(r0[:3],r1[:3]):
+            assert n.array_equal(a,b)
+        assert r0[3] == r1[3]
+    return(len(res[0]))
 
 if __name__ == "__main__":
     check_detectability(obj_id="2002 PZ39",id_type="smallbody",debug=True)
@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+'''Offline two-body ephemeris for near Earth objects.
+
+Produces the topocentric range, range-rate and elevation that
+neo_horizons.check_detectability gets from Horizons, using orbital
+elements (e.g., from SBDBlookup) and a Keplerian orbit around the Sun.
+Vectorized over objects and epochs.
+
+The Earth is placed using mean elements of the Earth-Moon barycenter
+(Standish, 1992) and a low precision lunar theory (Astronomical Almanac),
+which is good to a few hundred km. Planetary perturbations, Earth
+gravitational focusing and light time are ignored, so this is intended
+for screening, not for pointing.
+'''
+
+import numpy as n
+import datetime
+from lazy_import import lazy_module
+
+c=lazy_module("scipy.constants")
+
+# Gaussian gravitational constant (rad/day)
+k_gauss=0.01720209895
+# obliquity of the ecliptic at J2000 (deg)
+obliquity=23.4392911
+# Earth/Moon mass ratio
+earth_moon_ratio=81.30056
+# WGS84
+wgs84_a=6378137.0
+wgs84_f=1.0/298.257223563
+# Earth rotation rate (rad/s)
+omega_earth=7.2921150e-5
+# TT-UTC (s), valid since 2017
+tt_utc=69.184
+
+def value(x):
+    '''
+    float array from number, list or astropy quantity
+    '''
+    return(n.asarray(getattr(x,"value",x),dtype=n.float64))
+
+def unix2jd(t):
+    return(n.asarray(t,dtype=n.float64)/86400.0+2440587.5)
+
+def rot_x(ang):
+    ca,sa=n.cos(ang),n.sin(ang)
+    return(n.array([[1.0,0.0,0.0],[0.0,ca,-sa],[0.0,sa,ca]]))
+
+def solve_kepler(M,e,n_iter=50,tol=1e-12):
+    '''
+    Eccentric anomaly from mean anomaly M (rad) for elliptic orbits, vectorized.
+    '''
+    M=n.mod(M,2*n.pi)
+    E=n.where(e > 0.8,n.pi,M+e*n.sin(M))
+    for i in range(n_iter):
+        dE=(E-e*n.sin(E)-M)/(1.0-e*n.cos(E))
+        E=E-dE
+        if n.max(n.abs(dE)) < tol:
+            break
+    return(E)
+
+def orbit_state(a,e,i,om,w,M):
+    '''
+    Heliocentric ecliptic position (m) and velocity (m/s) from elements.
+    a in AU, angles in radians. All arguments broadcast.
+    returns arrays of shape (3,...)
+    '''
+    E=solve_kepler(M,e)
+    mm=k_gauss/a**1.5/86400.0   # mean motion rad/s
+    b=n.sqrt(1.0-e**2.0)
+    cE,sE=n.cos(E),n.sin(E)
+    # perifocal frame
+    x=a*c.au*(cE-e)
+    y=a*c.au*b*sE
+    f=mm*a*c.au/(1.0-e*cE)
+    vx=-f*sE
+    vy=f*b*cE
+
+    co,so=n.cos(om),n.sin(om)
+    cw,sw=n.cos(w),n.sin(w)
+    ci,si=n.cos(i),n.sin(i)
+    # rotation perifocal -> ecliptic, columns P and Q
+    P=n.array([co*cw-so*sw*ci,so*cw+co*sw*ci,sw*si])
+    Q=n.array([-co*sw-so*cw*ci,-so*sw+co*cw*ci,cw*si])
+    return(P*x+Q*y,P*vx+Q*vy)
+
+def moon_geocentric(jd):
+    '''
+    Low precision geocentric ecliptic position of the Moon (m), Astronomical Almanac.
+    '''
+    T=(jd-2451545.0)/36525.0
+    d=n.pi/180.0
+    lam=(218.32+481267.881*T+6.29*n.sin(d*(135.0+477198.87*T))-1.27*n.sin(d*(259.3-413335.36*T))
+         +0.66*n.sin(d*(235.7+890534.22*T))+0.21*n.sin(d*(269.9+954397.74*T))
+         -0.19*n.sin(d*(357.5+35999.05*T))-0.11*n.sin(d*(186.5+966404.03*T)))*d
+    beta=(5.13*n.sin(d*(93.3+483202.02*T))+0.28*n.sin(d*(228.2+960400.89*T))
+          -0.28*n.sin(d*(318.3+6003.15*T))-0.17*n.sin(d*(217.6-407332.21*T)))*d
+    par=(0.9508+0.0518*n.cos(d*(135.0+477198.87*T))+0.0095*n.cos(d*(259.3-413335.36*T))
+         +0.0078*n.cos(d*(235.7+890534.22*T))+0.0028*n.cos(d*(269.9+954397.74*T)))*d
+    dist=wgs84_a/n.sin(par)
+    return(dist*n.array([n.cos(beta)*n.cos(lam),n.cos(beta)*n.sin(lam),n.sin(beta)]))
+
+def earth_state(jd):
+    '''
+    Heliocentric ecliptic position (m) and velocity (m/s) of the Earth.
+    '''
+    T=(jd-2451545.0)/36525.0
+    d=n.pi/180.0
+    a=1.00000261+0.00000562*T
+    e=0.01671123-0.00004392*T
+    i=(-0.00001531-0.01294668*T)*d
+    L=(100.46457166+35999.37244981*T)*d
+    varpi=(102.93768193+0.32327364*T)*d
+    om=0.0*T
+    p,v=orbit_state(a,e,i,om,varpi-om,L-varpi)
+    # barycenter -> Earth
+    dt=60.0
+    m0=moon_geocentric(jd)
+    m1=moon_geocentric(jd+dt/86400.0)
+    p=p-m0/(1.0+earth_moon_ratio)
+    v=v-(m1-m0)/dt/(1.0+earth_moon_ratio)
+    return(p,v)
+
+def site_state(jd,obs_lat,obs_lon,obs_el):
+    '''
+    Geocentric equatorial (ICRF-like, no precession/nutation) position (m) and velocity (m/s)
+    of an observer, and unit vectors east, north, up.
+    '''
+    d=n.pi/180.0
+    lat=obs_lat*d
+    e2=wgs84_f*(2.0-wgs84_f)
+    N=wgs84_a/n.sqrt(1.0-e2*n.sin(lat)**2.0)
+    rho_xy=(N+obs_el)*n.cos(lat)
+    z=(N*(1.0-e2)+obs_el)*n.sin(lat)
+    # local sidereal angle
+    theta=(280.46061837+360.98564736629*(jd-2451545.0))*d+obs_lon*d
+    ct,st=n.cos(theta),n.sin(theta)
+    p=n.array([rho_xy*ct,rho_xy*st,z+0.0*theta])
+    v=n.array([-omega_earth*rho_xy*st,omega_earth*rho_xy*ct,0.0*theta])
+    cl,sl=n.cos(lat),n.sin(lat)
+    east=n.array([-st,ct,0.0*theta])
+    north=n.array([-sl*ct,-sl*st,cl+0.0*theta])
+    up=n.array([cl*ct,cl*st,sl+0.0*theta])
+    return(p,v,east,north,up)
+
+def topocentric(elements,t,
+                obs_lat=69.3908,
+                obs_lon=20.2673,
+                obs_el=0.0):
+    '''
+    Topocentric range (m), range-rate (m/s), azimuth and elevation (deg)
+    of one or many objects at unix times t.
+
+    elements - dict with a (AU), e, i, om, w (deg) and tp (time of perihelion, JD TDB).
+               scalars or arrays of length n_obj. astropy quantities are accepted.
+    t - unix times (UTC), length n_t
+
+    returns ranges, range_rates, azs, els. shape is (n_obj,n_t), or (n_t) for scalar elements.
+    '''
+    d=n.pi/180.0
+    scalar=n.ndim(value(elements["a"])) == 0
+    a=n.atleast_1d(value(elements["a"]))[:,None]
+    e=n.atleast_1d(value(elements["e"]))[:,None]
+    i=n.atleast_1d(value(elements["i"]))[:,None]*d
+    om=n.atleast_1d(value(elements["om"]))[:,None]*d
+    w=n.atleast_1d(value(elements["w"]))[:,None]*d
+    tp=n.atleast_1d(value(elements["tp"]))[:,None]
+
+    jd_utc=unix2jd(t)
+    jd=jd_utc+tt_utc/86400.0
+    mm=k_gauss/a**1.5
+    M=mm*(jd[None,:]-tp)
+    p_obj,v_obj=orbit_state(a,e,i,om,w,M)
+    p_earth,v_earth=earth_state(jd)
+    p_site,v_site,east,north,up=site_state(jd_utc,obs_lat,obs_lon,obs_el)
+
+    # geocentric, ecliptic -> equatorial
+    R=rot_x(obliquity*d)
+    p_geo=n.einsum("ij,j...->i...",R,p_obj-p_earth[:,None,:])
+    v_geo=n.einsum("ij,j...->i...",R,v_obj-v_earth[:,None,:])
+    p_top=p_geo-p_site[:,None,:]
+    v_top=v_geo-v_site[:,None,:]
+
+    ranges=n.sqrt(n.sum(p_top**2.0,axis=0))
+    range_rates=n.sum(p_top*v_top,axis=0)/ranges
+    u_e=n.sum(p_top*east[:,None,:],axis=0)
+    u_n=n.sum(p_top*north[:,None,:],axis=0)
+    u_u=n.sum(p_top*up[:,None,:],axis=0)
+    els=n.arcsin(u_u/ranges)/d
+    azs=n.mod(n.arctan2(u_e,u_n)/d,360.0)
+    if scalar:
+        return(ranges[0],range_rates[0],azs[0],els[0])
+    return(ranges,range_rates,azs,els)
+
+def check_detectability(elements,
+                        obs_lat=69.3908,
+                        obs_lon=20.2673,
+                        obs_el=0.0,
+                        start="2020-01-01",
+                        stop="2020-06-01",
+                        step="2h",
+                        min_el=30.0):
+    '''
+    Same as neo_horizons.check_detectability, but computed from orbital elements.
+    returns ranges (m), range_rates (m/s), els (deg) and date strings ("%Y-%b-%d %H:%M",
+    as in Horizons tables) above min_el.
+    For arrays of elements, returns a list with one such tuple per object.
+    '''
+    import neo_horizons
+    t=n.arange(neo_horizons.date2unix(start),neo_horizons.date2unix(stop)+1,neo_horizons.step_seconds(step))
+    ranges,range_rates,azs,els=topocentric(elements,t,obs_lat=obs_lat,obs_lon=obs_lon,obs_el=obs_el)
+    dates=n.array([datetime.datetime.fromtimestamp(x,datetime.timezone.utc).strftime("%Y-%b-%d %H:%M") for x in t])
+    ok=els > min_el
+    if ok.ndim == 1:
+        return(ranges[ok],range_rates[ok],els[ok],list(dates[ok]))
+    return([(ranges[o][ok[o]],range_rates[o][ok[o]],els[o][ok[o]],list(dates[ok[o]])) for o in range(ok.shape[0])])
+
+if __name__ == "__main__":
+    # elements of two objects: array and one at a time calls should agree
+    elements={"a":n.array([1.2,0.9]),"e":n.array([0.3,0.2]),"i":n.array([5.0,12.0]),
+              "om":n.array([100.0,250.0]),"w":n.array([30.0,200.0]),"tp":n.array([2458900.5,2458950.5])}
+    res=check_detectability(elements,start="2020-01-01",stop="2020-02-01",step="1h",min_el=-90.0)
+    for o in range(2):
+        one=check_detectability({k:v[o] for k,v in elements.items()},start="2020-01-01",stop="2020-02-01",step="1h",min_el=-90.0)
+        for x,y in zip(res[o][:3],one[:3]):
+            assert n.allclose(x,y)
+        assert res[o][3] == one[3]
+        print("object %d %d points, first %s range %1.4g m el %1.2f"%(o,len(one[0]),one[3][0],one[0][0],one[2][0]))
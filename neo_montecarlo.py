@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+'''Monte Carlo forecast of serendipitous radar detections of small NEOs.
+
+Objects are drawn from the impactor size distribution of serendip_neo_model,
+with isotropic arrival directions, a speed distribution and uniformly
+distributed impact parameters. Each object moves on a straight line past
+the Earth (no gravitational focusing, no Earth rotation during the pass).
+An object is detected if, while one of the beam positions of a scan
+strategy is active, it is inside that beam, above the horizon, and close
+enough for the coherent SNR of neo_snr.detectability_batch to exceed the
+detection threshold for at least the coherent integration time. The gain
+of a planar array is reduced off zenith.
+
+Beam and detection-sphere crossings are computed in closed form, so
+there is no time sampling. Diameters are stratified in logarithmic bins,
+and each bin is simulated in independent batches with seeds spawned from
+one SeedSequence, so results do not depend on the number of processes.
+'''
+
+import numpy as n
+import multiprocessing
+
+import neo_snr
+import serendip_neo_model as snm
+from lazy_import import lazy_module
+
+stats=lazy_module("scipy.stats")
+
+R_e=6371e3
+
+def fixed_beam(az=0.0,el=90.0):
+    return({"beams":[(az,el)],"dwell":1.0})
+
+def fence_scan(n_beams=20,min_el=30.0,az=0.0,dwell=2.0):
+    '''
+    n_beams positions on a meridian from min_el through zenith to min_el on the opposite side,
+    each active for dwell seconds in turn.
+    '''
+    el=n.linspace(min_el,180.0-min_el,num=n_beams)
+    beams=[(az,e) if e <= 90.0 else (az+180.0,180.0-e) for e in el]
+    return({"beams":beams,"dwell":dwell})
+
+def beam_vector(az,el):
+    '''
+    unit vector in local east, north, up coordinates. az and el in degrees.
+    '''
+    az=n.radians(az)
+    el=n.radians(el)
+    return(n.array([n.cos(el)*n.sin(az),n.cos(el)*n.cos(az),n.sin(el)]))
+
+def beam_half_width(r):
+    '''
+    half-width (rad) of a cone with the solid angle 4 pi/G of the main lobe
+    '''
+    return(n.sqrt(4.0/r.gain))
+
+def sample_diameters(rng,n_obj,d_min,d_max,alpha=2.7):
+    '''
+    diameters from the cumulative power law N(>d) ~ d^-alpha, truncated to [d_min,d_max]
+    '''
+    u=rng.random(n_obj)
+    return((d_min**(-alpha)-u*(d_min**(-alpha)-d_max**(-alpha)))**(-1.0/alpha))
+
+def sample_speeds(rng,n_obj,v_mean=20e3,v_std=7e3,v_min=11.2e3,v_max=72e3):
+    '''
+    geocentric speeds (m/s), normal distribution truncated to [v_min,v_max]
+    '''
+    a=(v_min-v_mean)/v_std
+    b=(v_max-v_mean)/v_std
+    return(stats.truncnorm.rvs(a,b,loc=v_mean,scale=v_std,size=n_obj,random_state=rng))
+
+def sample_lines(rng,n_obj,b_max):
+    '''
+    isotropic directions u and impact parameter vectors b (perpendicular to u, uniform over
+    a disk of radius b_max). The position is b+u*v*t, with t=0 at the closest approach to the Earth center.
+    '''
+    u=rng.normal(size=(3,n_obj))
+    u=u/n.sqrt(n.sum(u**2.0,axis=0))
+    ref=n.where(n.abs(u[0]) < 0.9,n.array([1.0,0.0,0.0])[:,None],n.array([0.0,1.0,0.0])[:,None])
+    e1=n.cross(u,ref,axis=0)
+    e1=e1/n.sqrt(n.sum(e1**2.0,axis=0))
+    e2=n.cross(u,e1,axis=0)
+    rho=b_max*n.sqrt(rng.random(n_obj))
+    phi=2.0*n.pi*rng.random(n_obj)
+    return(u,rho*(n.cos(phi)*e1+n.sin(phi)*e2))
+
+def halfline(c0,c1):
+    '''
+    interval of t where c0+c1*t >= 0
+    '''
+    with n.errstate(divide="ignore",invalid="ignore"):
+        t0=-c0/c1
+    lo=n.where(c1 > 0,t0,-n.inf)
+    hi=n.where(c1 < 0,t0,n.inf)
+    none=(c1 == 0) & (c0 < 0)
+    return(n.where(none,n.inf,lo),n.where(none,-n.inf,hi))
+
+def quadratic_roots(A,B,C):
+    disc=B**2.0-4.0*A*C
+    sq=n.sqrt(n.maximum(disc,0.0))
+    with n.errstate(divide="ignore",invalid="ignore"):
+        r1=(-B-sq)/(2.0*A)
+        r2=(-B+sq)/(2.0*A)
+    return(n.minimum(r1,r2),n.maximum(r1,r2),disc)
+
+def cone_interval(y0,w,a,half_width):
+    '''
+    interval of t where y0+w*t is inside the cone with axis a and the given half-width (rad).
+    The forward cone is convex, so the intersection with a line is one interval.
+    '''
+    c2=n.cos(half_width)**2.0
+    ya=n.einsum("i...,i->...",y0,a)
+    wa=n.einsum("i...,i->...",w,a)
+    A=wa**2.0-c2*n.sum(w**2.0,axis=0)
+    B=2.0*(ya*wa-c2*n.sum(y0*w,axis=0))
+    C=ya**2.0-c2*n.sum(y0**2.0,axis=0)
+    A=n.where(A == 0,1e-300,A)
+    r1,r2,disc=quadratic_roots(A,B,C)
+    # pieces of the double cone
+    neg=A < 0
+    lo1=n.where(neg,r1,-n.inf)
+    hi1=n.where(neg,r2,r1)
+    lo2=n.where(neg,n.inf,r2)
+    hi2=n.where(neg,-n.inf,n.inf)
+    # no real roots: the line is outside the cone (A<0) or inside one nappe everywhere (A>0)
+    nr=disc < 0
+    lo1=n.where(nr,n.where(neg,n.inf,-n.inf),lo1)
+    hi1=n.where(nr,n.where(neg,-n.inf,n.inf),hi1)
+    lo2=n.where(nr,n.inf,lo2)
+    hi2=n.where(nr,-n.inf,hi2)
+    # forward nappe
+    glo,ghi=halfline(ya,wa)
+    lo1,hi1=n.maximum(lo1,glo),n.minimum(hi1,ghi)
+    lo2,hi2=n.maximum(lo2,glo),n.minimum(hi2,ghi)
+    ok1=lo1 <= hi1
+    ok2=lo2 <= hi2
+    lo=n.where(ok1,lo1,lo2)
+    hi=n.where(ok1,hi1,hi2)
+    both=ok1 & ok2
+    lo=n.where(both,n.minimum(lo1,lo2),lo)
+    hi=n.where(both,n.maximum(hi1,hi2),hi)
+    return(lo,hi)
+
+def simulate_batch(args):
+    '''
+    Simulate n_obj objects with diameters in [d_min,d_max]. returns the number of detections.
+    '''
+    r,strategy,d_min,d_max,n_obj,b_max,seed,opts=args
+    rng=n.random.default_rng(seed)
+    d=sample_diameters(rng,n_obj,d_min,d_max)
+    v=sample_speeds(rng,n_obj)
+    u,b=sample_lines(rng,n_obj,b_max)
+    r_det=neo_snr.detection_range(r,d,snr_threshold=opts["snr_threshold"],radar_albedo=opts["radar_albedo"])
+    t_min=r.max_coh_int_time
+
+    p_r=n.array([0.0,0.0,R_e])
+    up=n.array([0.0,0.0,1.0])
+    y0=b-p_r[:,None]
+    w=u*v
+    # above the horizon
+    hlo,hhi=halfline(n.einsum("i...,i->...",y0,up),n.einsum("i...,i->...",w,up))
+    # before hitting the ground
+    rho=n.sqrt(n.sum(b**2.0,axis=0))
+    t_imp=n.where(rho < R_e,-n.sqrt(n.maximum(R_e**2.0-rho**2.0,0.0))/v,n.inf)
+    hhi=n.minimum(hhi,t_imp)
+
+    beams=strategy["beams"]
+    dwell=strategy["dwell"]
+    period=dwell*len(beams)
+    phase=period*rng.random(n_obj)
+    half_width=opts["half_width"]
+    detected=n.zeros(n_obj,dtype=bool)
+    for k,(az,el) in enumerate(beams):
+        # a planar array has gain G sin(el) on transmit and receive (see neo_snr.evaluate_geometry),
+        # so the SNR scales with sin(el)^2 and the detection range with sin(el)^(1/2)
+        r_beam=r_det*n.sin(n.radians(el))**0.5 if opts["planar_array"] else r_det
+        # inside the detection sphere around the radar
+        sr1,sr2,disc=quadratic_roots(n.sum(w**2.0,axis=0),2.0*n.sum(y0*w,axis=0),n.sum(y0**2.0,axis=0)-r_beam**2.0)
+        lo=n.maximum(n.where(disc >= 0,sr1,n.inf),hlo)
+        hi=n.minimum(n.where(disc >= 0,sr2,-n.inf),hhi)
+        clo,chi=cone_interval(y0,w,beam_vector(az,el),half_width)
+        a=n.maximum(lo,clo)
+        e=n.minimum(hi,chi)-t_min
+        if len(beams) == 1:
+            detected|=a <= e
+            continue
+        # beam k is active for t in [m*period+k*dwell-phase, m*period+(k+1)*dwell-phase).
+        # the object needs to stay t_min in the beam, so the window start has to be in
+        # [m*period+k*dwell-phase, m*period+(k+1)*dwell-phase-t_min] and in [a,e].
+        with n.errstate(invalid="ignore"):
+            s=n.mod(a+phase-k*dwell,period)
+        ok=(a <= e) & ((s <= dwell-t_min) | (e-a >= period-s))
+        detected|=ok
+    return(int(n.sum(detected)))
+
+def binomial_interval(k,n_trials,confidence=0.95):
+    '''
+    Clopper-Pearson interval for a binomial proportion
+    '''
+    k=n.asarray(k,dtype=n.float64)
+    n_trials=n.asarray(n_trials,dtype=n.float64)
+    a=0.5*(1.0-confidence)
+    lo=n.where(k > 0,stats.beta.ppf(a,n.maximum(k,1e-300),n_trials-k+1),0.0)
+    hi=n.where(k < n_trials,stats.beta.ppf(1.0-a,k+1,n.maximum(n_trials-k,1e-300)),1.0)
+    return(lo,hi)
+
+def forecast(r=None,
+             strategy=None,
+             d_edges=10**n.linspace(n.log10(0.02),1.0,num=21),
+             n_obj=100000,
+             batch_size=20000,
+             snr_threshold=10.0,
+             radar_albedo=0.1,
+             half_width=None,
+             planar_array=True,
+             confidence=0.95,
+             seed=0,
+             n_proc=None):
+    '''
+    Detections per year for each diameter bin.
+
+    r - radar (neo_snr.radar), default E3D
+    strategy - dict with "beams", a list of (az,el) beam positions in degrees, and
+               "dwell", the time in seconds each position is active. default fixed zenith beam.
+    d_edges - diameter bin edges (m)
+    n_obj - number of simulated objects per bin
+    half_width - beam half-width (rad), default beam_half_width(r)
+    planar_array - the gain of r is reduced by sin(el) off zenith, as in neo_snr.evaluate_geometry.
+                   set to False for a dish
+
+    returns a dict with bin edges, number of detections and simulated objects per bin,
+    detections per year and its confidence interval per bin, and the total. The interval of
+    the total is the sum of the per-bin intervals, which is conservative.
+    '''
+    if r is None:
+        r=neo_snr.e3d_radar()
+    if strategy is None:
+        strategy=fixed_beam()
+    if half_width is None:
+        half_width=beam_half_width(r)
+    opts={"snr_threshold":snr_threshold,"radar_albedo":radar_albedo,"half_width":half_width,"planar_array":planar_array}
+    d_edges=n.asarray(d_edges,dtype=n.float64)
+    n_bins=len(d_edges)-1
+
+    # objects passing further than the detection range of the largest object in a bin
+    # from the radar cannot be detected
+    b_max=neo_snr.detection_range(r,d_edges[1:],snr_threshold=snr_threshold,radar_albedo=radar_albedo)+R_e
+    # objects per year through a disk of radius b_max
+    rate=(snm.neo_cumulative_flux(d_edges[:-1])-snm.neo_cumulative_flux(d_edges[1:]))*n.pi*b_max**2.0/snm.earth_cross_section
+
+    n_batches=int(n.ceil(n_obj/batch_size))
+    seeds=n.random.SeedSequence(seed).spawn(n_bins*n_batches)
+    tasks=[]
+    for bi in range(n_bins):
+        for j in range(n_batches):
+            m=min(batch_size,n_obj-j*batch_size)
+            tasks.append((r,strategy,d_edges[bi],d_edges[bi+1],m,b_max[bi],seeds[bi*n_batches+j],opts))
+    if n_proc == 1:
+        counts=list(map(simulate_batch,tasks))
+    else:
+        pool=multiprocessing.Pool(n_proc)
+        try:
+            counts=pool.map(simulate_batch,tasks)
+        finally:
+            pool.terminate()
+    k=n.sum(n.reshape(n.array(counts),[n_bins,n_batches]),axis=1)
+    n_trials=n.full(n_bins,n_obj)
+    p_lo,p_hi=binomial_interval(k,n_trials,confidence=confidence)
+    per_year=rate*k/n_trials
+    return({"d_edges":d_edges,
+            "detections":k,
+            "n_obj":n_trials,
+            "per_year":per_year,
+            "per_year_lo":rate*p_lo,
+            "per_year_hi":rate*p_hi,
+            "total":n.sum(per_year),
+            "total_lo":n.sum(rate*p_lo),
+            "total_hi":n.sum(rate*p_hi)})
+
+if __name__ == "__main__":
+    r=neo_snr.e3d_radar()
+    for name,strategy in [("fixed beam",fixed_beam()),("20-position fence",fence_scan())]:
+        res=forecast(r,strategy,n_obj=50000)
+        print("%s: %1.1f detections per year (%1.1f-%1.1f)"%(name,res["total"],res["total_lo"],res["total_hi"]))
+        for i in range(len(res["per_year"])):
+            print("  %1.3f-%1.3f m %1.2g (%1.2g-%1.2g)"%(res["d_edges"][i],res["d_edges"][i+1],
+                                                        res["per_year"][i],res["per_year_lo"][i],res["per_year_hi"][i]))
@@ -0,0 +1,338 @@
+#!/usr/bin/env python
+'''Radar time allocation for observable windows of many objects.
+
+Observable windows are runs of time steps where an object is observable
+(e.g., above the elevation limit with SNR above threshold). They are kept
+in flat arrays sorted by start time (window_dtype). The radar observes one
+object at a time, and moving from one object to the next takes slew_time
+seconds. The total observing time can be limited to a fraction (duty
+cycle) of the scheduling period.
+
+greedy_schedule - many tracked objects. Each object is tracked once for
+                  track_len seconds, anywhere in one of its windows. Windows
+                  are taken in order of their end time and each track is
+                  started as early as possible. This is a heuristic, it is not
+                  guaranteed to track the largest possible number of objects.
+weighted_schedule - maximize the total weight (e.g., integrated SNR) of
+                    fixed intervals, by weighted interval scheduling
+                    (dynamic programming over intervals sorted by end time).
+                    This is optimal without a duty cycle limit, but the same
+                    object can be observed in several windows. With
+                    one_per_object, repeated objects are removed and the free
+                    time is filled with windows of other objects, which is a
+                    heuristic for the tracked object count.
+
+python neo_schedule.py checks the schedules on small random problems against
+exhaustive search.
+'''
+
+import numpy as n
+
+window_dtype=n.dtype([("obj","i8"),
+                      ("start","f8"),
+                      ("stop","f8"),
+                      ("weight","f8"),
+                      ("i0","i8"),
+                      ("i1","i8")])
+
+def _runs(ok):
+    '''
+    start and stop (exclusive) indices of runs of True along the last axis of a 2d array.
+    returns row, start, stop arrays, ordered by row and start.
+    '''
+    pad=n.zeros((ok.shape[0],1),dtype=n.int8)
+    d=n.diff(n.concatenate([pad,ok.astype(n.int8),pad],axis=1),axis=1)
+    rs,i0=n.nonzero(d == 1)
+    re,i1=n.nonzero(d == -1)
+    return(rs,i0,i1)
+
+def windows_from_mask(t,ok,weight=None):
+    '''
+    Windows from per-object, per-time step observability.
+
+    t - time step start times (s), length n_t, uniform spacing
+    ok - boolean array (n_obj,n_t), True where the object is observable
+    weight - optional array (n_obj,n_t) (e.g., SNR), integrated over each window
+
+    returns an array with window_dtype sorted by start time. i0 and i1 are the
+    first and last+1 time step of the window.
+    '''
+    t=n.asarray(t,dtype=n.float64)
+    ok=n.atleast_2d(ok)
+    dt=t[1]-t[0] if len(t) > 1 else 1.0
+    obj,i0,i1=_runs(ok)
+    w=n.zeros(len(obj),dtype=window_dtype)
+    w["obj"]=obj
+    w["i0"]=i0
+    w["i1"]=i1
+    w["start"]=t[i0]
+    w["stop"]=t[i1-1]+dt
+    if weight is None:
+        w["weight"]=w["stop"]-w["start"]
+    else:
+        cs=n.concatenate([n.zeros((ok.shape[0],1)),n.cumsum(n.where(ok,weight,0.0)*dt,axis=1)],axis=1)
+        w["weight"]=cs[obj,i1]-cs[obj,i0]
+    return(w[n.argsort(w["start"],kind="stable")])
+
+def windows_from_series(obj,t,ok,weight=None,dt=None):
+    '''
+    Windows of one object from an irregular time series, e.g., ephemeris points above
+    the elevation limit. Consecutive points more than 1.5 dt apart start a new window.
+    '''
+    t=n.asarray(t,dtype=n.float64)
+    ok=n.asarray(ok,dtype=bool)
+    if dt is None:
+        dt=n.min(n.diff(t)) if len(t) > 1 else 1.0
+    # a time step that does not follow the previous one is a break in the series
+    brk=n.concatenate([[True],n.diff(t) > 1.5*dt])
+    seg=n.cumsum(brk)-1
+    # split runs at breaks by inserting a gap
+    ok2=n.zeros(len(t)+seg[-1] if len(t) > 0 else 0,dtype=bool)
+    pos=n.arange(len(t))+seg
+    ok2[pos]=ok
+    rs,i0,i1=_runs(ok2[None,:])
+    # back to indices of t
+    inv=n.zeros(len(ok2),dtype=n.int64)
+    inv[pos]=n.arange(len(t))
+    i0=inv[i0]
+    i1=inv[i1-1]+1
+    w=n.zeros(len(i0),dtype=window_dtype)
+    w["obj"]=obj
+    w["i0"]=i0
+    w["i1"]=i1
+    w["start"]=t[i0]
+    w["stop"]=t[i1-1]+dt
+    if weight is None:
+        w["weight"]=w["stop"]-w["start"]
+    else:
+        cs=n.concatenate([[0.0],n.cumsum(n.where(ok,weight,0.0)*dt)])
+        w["weight"]=cs[i1]-cs[i0]
+    return(w)
+
+def merge_windows(windows):
+    '''
+    concatenate window arrays and sort by start time
+    '''
+    w=n.concatenate(windows) if len(windows) > 0 else n.zeros(0,dtype=window_dtype)
+    return(w[n.argsort(w["start"],kind="stable")])
+
+class interval_index:
+    '''
+    Windows sorted by start time, with the running maximum of stop times,
+    for finding the windows that overlap a time interval with two binary searches.
+    '''
+    def __init__(self,windows):
+        self.idx=n.argsort(windows["start"],kind="stable")
+        self.start=windows["start"][self.idx]
+        self.stop=windows["stop"][self.idx]
+        self.max_stop=n.maximum.accumulate(self.stop) if len(self.stop) > 0 else self.stop
+
+    def overlapping(self,t0,t1):
+        '''
+        indices (into the original window array) of windows overlapping [t0,t1)
+        '''
+        j1=n.searchsorted(self.start,t1,side="left")
+        j0=n.searchsorted(self.max_stop,t0,side="right")
+        j=n.arange(j0,j1)
+        return(self.idx[j[self.stop[j] > t0]])
+
+    def count(self,t):
+        '''
+        number of windows open at times t
+        '''
+        return(n.searchsorted(self.start,t,side="right")-n.searchsorted(n.sort(self.stop),t,side="right"))
+
+def greedy_schedule(windows,track_len=600.0,slew_time=60.0,duty_cycle=1.0,t_range=None):
+    '''
+    Track many objects, one track of track_len seconds per object (heuristic, not optimal).
+
+    returns indices of the windows used and track start times
+    '''
+    if t_range is None:
+        t_range=(n.min(windows["start"]),n.max(windows["stop"])) if len(windows) > 0 else (0.0,0.0)
+    budget=duty_cycle*(t_range[1]-t_range[0])
+    feasible=n.nonzero(windows["stop"]-windows["start"] >= track_len)[0]
+    order=feasible[n.argsort(windows["stop"][feasible],kind="stable")]
+    tracked=set()
+    t_free=-n.inf
+    used=0.0
+    sel=[]
+    t0s=[]
+    for i in order:
+        o=windows["obj"][i]
+        if o in tracked:
+            continue
+        t0=max(windows["start"][i],t_free+slew_time)
+        if t0+track_len <= windows["stop"][i] and used+track_len <= budget:
+            sel.append(i)
+            t0s.append(t0)
+            tracked.add(o)
+            t_free=t0+track_len
+            used+=track_len
+    return(n.array(sel,dtype=n.int64),n.array(t0s))
+
+def fill_gaps(windows,sel,slew_time=60.0,idx=None):
+    '''
+    Add windows of objects that are not in the schedule sel to the free time between the
+    scheduled windows, the window with the largest weight first. Candidates for each gap
+    are found with an interval_index of all windows (idx).
+
+    returns indices of the scheduled windows, in time order
+    '''
+    if idx is None:
+        idx=interval_index(windows)
+    sel=n.asarray(sel,dtype=n.int64)
+    sel=sel[n.argsort(windows["start"][sel],kind="stable")]
+    tracked=n.zeros(n.max(windows["obj"])+1 if len(windows) > 0 else 0,dtype=bool)
+    tracked[windows["obj"][sel]]=True
+    gaps=list(zip(n.concatenate([[-n.inf],windows["stop"][sel]+slew_time]),
+                  n.concatenate([windows["start"][sel]-slew_time,[n.inf]])))
+    added=[]
+    while len(gaps) > 0:
+        g0,g1=gaps.pop()
+        if g1 <= g0:
+            continue
+        cand=idx.overlapping(g0,g1)
+        cand=cand[(windows["start"][cand] >= g0) & (windows["stop"][cand] <= g1)]
+        cand=cand[n.logical_not(tracked[windows["obj"][cand]])]
+        if len(cand) == 0:
+            continue
+        best=cand[n.argmax(windows["weight"][cand])]
+        added.append(best)
+        tracked[windows["obj"][best]]=True
+        gaps.append((g0,windows["start"][best]-slew_time))
+        gaps.append((windows["stop"][best]+slew_time,g1))
+    sel=n.concatenate([sel,n.array(added,dtype=n.int64)])
+    return(sel[n.argsort(windows["start"][sel],kind="stable")])
+
+def weighted_schedule(windows,slew_time=60.0,duty_cycle=1.0,t_range=None,one_per_object=False):
+    '''
+    Non-overlapping subset of the intervals (start, stop) with the largest total weight.
+    Consecutive intervals must be at least slew_time apart.
+
+    With one_per_object, only the window with the largest weight is kept for each object,
+    and the free time is filled with windows of objects that are not yet scheduled (fill_gaps).
+    The result is then not guaranteed to be optimal, either for the total weight or for the
+    number of objects.
+
+    The duty cycle limit is applied afterwards, by removing the intervals with the
+    smallest weight per second until the total time fits. This keeps the schedule
+    feasible but is not guaranteed to be optimal.
+
+    returns indices of the selected intervals, in time order
+    '''
+    n_w=len(windows)
+    if n_w == 0:
+        return(n.zeros(0,dtype=n.int64))
+    if t_range is None:
+        t_range=(n.min(windows["start"]),n.max(windows["stop"]))
+    order=n.argsort(windows["stop"],kind="stable")
+    start=windows["start"][order]
+    stop=windows["stop"][order]
+    weight=windows["weight"][order]
+    # p[j] = number of intervals ending early enough to precede interval j
+    p=n.searchsorted(stop,start-slew_time,side="right")
+    best=n.zeros(n_w+1)
+    take=n.zeros(n_w,dtype=bool)
+    for j in range(n_w):
+        with_j=weight[j]+best[p[j]]
+        take[j]=with_j > best[j]
+        best[j+1]=with_j if take[j] else best[j]
+    sel=[]
+    j=n_w
+    while j > 0:
+        if take[j-1]:
+            sel.append(j-1)
+            j=p[j-1]
+        else:
+            j-=1
+    sel=order[n.array(sel[::-1],dtype=n.int64)]
+
+    if one_per_object:
+        # best window of each object
+        by_weight=sel[n.argsort(-windows["weight"][sel],kind="stable")]
+        u,first=n.unique(windows["obj"][by_weight],return_index=True)
+        sel=fill_gaps(windows,by_weight[first],slew_time=slew_time)
+
+    budget=duty_cycle*(t_range[1]-t_range[0])
+    dur=windows["stop"][sel]-windows["start"][sel]
+    if n.sum(dur) > budget:
+        rank=n.argsort(-windows["weight"][sel]/dur,kind="stable")
+        keep=rank[n.cumsum(dur[rank]) <= budget]
+        sel=sel[n.sort(keep)]
+    return(sel[n.argsort(windows["start"][sel],kind="stable")])
+
+def schedule_summary(windows,sel,t0=None,track_len=None):
+    '''
+    number of objects, total observing time and total weight of a schedule
+    '''
+    if t0 is None:
+        dur=windows["stop"][sel]-windows["start"][sel]
+    else:
+        dur=n.full(len(sel),track_len)
+    return({"n_obj":len(n.unique(windows["obj"][sel])),
+            "obs_time":float(n.sum(dur)),
+            "weight":float(n.sum(windows["weight"][sel]))})
+
+if __name__ == "__main__":
+    # self-check on small random problems, against exhaustive search
+    rng=n.random.RandomState(0)
+
+    def random_windows(n_w,n_obj):
+        w=n.zeros(n_w,dtype=window_dtype)
+        w["obj"]=rng.randint(0,n_obj,size=n_w)
+        w["start"]=rng.uniform(0.0,10000.0,size=n_w)
+        w["stop"]=w["start"]+rng.uniform(100.0,3000.0,size=n_w)
+        w["weight"]=rng.uniform(0.0,1.0,size=n_w)*(w["stop"]-w["start"])
+        return(w[n.argsort(w["start"],kind="stable")])
+
+    def feasible(start,stop,slew_time):
+        o=n.argsort(start)
+        return(bool(n.all(start[o][1:] >= stop[o][:-1]+slew_time)))
+
+    ratio=[]
+    for trial in range(300):
+        w=random_windows(rng.randint(1,11),rng.randint(1,6))
+        slew=rng.uniform(0.0,200.0)
+        span=n.max(w["stop"])-n.min(w["start"])
+
+        # interval index against a linear scan
+        idx=interval_index(w)
+        t0=rng.uniform(-1000.0,12000.0)
+        t1=t0+rng.uniform(0.0,3000.0)
+        assert set(idx.overlapping(t0,t1).tolist()) == set(n.nonzero((w["start"] < t1) & (w["stop"] > t0))[0].tolist())
+        assert idx.count(t0) == n.sum((w["start"] <= t0) & (w["stop"] > t0))
+
+        # greedy: one track per object, inside its window, no overlaps, within the duty cycle budget
+        duty=rng.uniform(0.1,1.0)
+        sel,t0s=greedy_schedule(w,track_len=500.0,slew_time=slew,duty_cycle=duty)
+        assert len(set(w["obj"][sel].tolist())) == len(sel)
+        assert n.all(t0s >= w["start"][sel]) and n.all(t0s+500.0 <= w["stop"][sel])
+        assert feasible(t0s,t0s+500.0,slew)
+        assert 500.0*len(sel) <= duty*span
+
+        # best total weight of all feasible subsets, and of those with one window per object
+        best=0.0
+        best1=0.0
+        for m in range(1,2**len(w)):
+            s=n.nonzero((m >> n.arange(len(w))) & 1)[0]
+            if feasible(w["start"][s],w["stop"][s],slew):
+                best=max(best,n.sum(w["weight"][s]))
+                if len(n.unique(w["obj"][s])) == len(s):
+                    best1=max(best1,n.sum(w["weight"][s]))
+
+        sel=weighted_schedule(w,slew_time=slew)
+        assert feasible(w["start"][sel],w["stop"][sel],slew)
+        assert abs(n.sum(w["weight"][sel])-best) <= 1e-9*best
+
+        sel=weighted_schedule(w,slew_time=slew,one_per_object=True)
+        assert feasible(w["start"][sel],w["stop"][sel],slew)
+        assert len(n.unique(w["obj"][sel])) == len(sel)
+        assert n.sum(w["weight"][sel]) <= best1*(1.0+1e-9)
+        if best1 > 0:
+            ratio.append(n.sum(w["weight"][sel])/best1)
+
+        sel=weighted_schedule(w,slew_time=slew,duty_cycle=duty)
+        assert feasible(w["start"][sel],w["stop"][sel],slew)
+        assert n.sum(w["stop"][sel]-w["start"][sel]) <= duty*span*(1.0+1e-9)
+    print("schedules ok. weighted_schedule with one_per_object reaches %1.3f of the optimum on average, %1.3f at worst"%(n.mean(ratio),n.min(ratio)))
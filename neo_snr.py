@@ -1,23 +1,37 @@
 #!/usr/bin/env python
 
 import numpy as n
-import matplotlib.pyplot as plt
-import scipy.constants as c
-import datetime
 import stuffr
 import re
+import os
+import copy
+import json
 
 import neo_cat
+import neo_cache
+import scattering
 import neo_horizons
+from lazy_import import lazy_module
+
+c=lazy_module("scipy.constants")
 
 class radar:
-    def __init__(self,gain,tx_pwr,duty_cycle,wavelength,noise_temp,max_coh_int_time=0.2):
+    def __init__(self,gain,tx_pwr,duty_cycle,wavelength,noise_temp,max_coh_int_time=0.2,aperture_m=None):
         self.gain=gain
         self.tx_pwr=tx_pwr
         self.duty_cycle=duty_cycle
         self.wavelength=wavelength
         self.noise_temp=noise_temp
         self.max_coh_int_time=max_coh_int_time
+        self.aperture_m=aperture_m
+
+    def aperture(self):
+        """
+        antenna diameter (m). if not given, the diameter of a uniformly illuminated circular aperture with this gain.
+        """
+        if self.aperture_m is None:
+            return(self.wavelength*n.sqrt(self.gain)/n.pi)
+        return(self.aperture_m)
         
 class space_object:
     def __init__(self,diameter_m,range_m,spin_period_s=3600.0,radar_albedo=0.1):
@@ -30,10 +44,11 @@ def hard_target_s_n(gain_tx, gain_rx,
                     wavelength_m, power_tx,
                     range_tx_m, range_rx_m,
                     diameter_m=0.01,
-                    radar_albedo=0.1):
+                    radar_albedo=0.1,
+                    rcs_model="rayleigh_optical"):
     '''
     Deterine the energy-to-noise ratio for a hard target (signal-to-noise ratio).
-    Assume a smooth transition between Rayleigh and optical scattering.
+    By default, assume a smooth transition between Rayleigh and optical scattering.
     
     gain_tx - transmit antenna gain, linear
     gain_rx - receiver antenna gain, linear
@@ -44,19 +59,10 @@ def hard_target_s_n(gain_tx, gain_rx,
     diameter_m - object diameter (meters)
     radar_albedo - how much is the rcs compared to the rcs of a perfectly 
                  conducting sphere. 
+    rcs_model - radar cross-section model (see scattering.models)
     '''
-    
-    ##
-    ## Determine returned signal power, given diameter of sphere
-    ## Ignore resonant regime and use either optical or rayleigh scatter.
-    ## This is essentially the same as the NASA SEM model for space
-    ## debris RCS. 
-    ##
-    is_rayleigh = diameter_m < wavelength_m/(n.pi*n.sqrt(3.0))
-    is_optical = diameter_m >= wavelength_m/(n.pi*n.sqrt(3.0))
-    rayleigh_power = (9.0*power_tx*(((gain_tx*gain_rx)*(n.pi**2.0)*(diameter_m**6.0))/(256.0*(wavelength_m**2.0)*(range_rx_m**2.0*range_tx_m**2.0))))
-    optical_power = (power_tx*(((gain_tx*gain_rx)*(wavelength_m**2.0)*(diameter_m**2.0)))/(256.0*(n.pi**2)*(range_rx_m**2.0*range_tx_m**2.0)))
-    return(   ((is_rayleigh)*rayleigh_power + (is_optical)*optical_power)*radar_albedo ) 
+    sigma=scattering.rcs(diameter_m,wavelength_m,model=rcs_model)
+    return(power_tx*gain_tx*gain_rx*wavelength_m**2.0*sigma*radar_albedo/((4.0*n.pi)**3.0*range_rx_m**2.0*range_tx_m**2.0))
 
 def incoh_snr_calc(p_s, p_n, epsilon=0.05, B=10.0, t_incoh=3600.0):
     """
@@ -124,6 +130,126 @@ def detectability(r,o, t_obs=3600.0,debug=False):
     return(snr_coh,snr_incoh)
 
 
+def detectability_batch(r, diameter_m, range_m,
+                        spin_period_s=3600.0,
+                        radar_albedo=0.1,
+                        gain=None,
+                        t_obs=3600.0,
+                        rcs_model="rayleigh_optical"):
+    """
+    Vectorized version of detectability() for many objects and/or ephemeris steps.
+
+    r = radar
+    diameter_m, range_m, spin_period_s, radar_albedo = object parameters (arrays or scalars)
+    gain = per-element antenna gain (linear), e.g., for a planar array steered off zenith.
+           defaults to r.gain
+    t_obs = observation duration
+    rcs_model = radar cross-section model (see scattering.models)
+
+    All parameters are broadcast against each other, so a catalog can be evaluated
+    with arrays of shape (n_obj,1) against per-step ranges of shape (n_obj,n_step).
+
+    returns:
+    snr_coh, snr_incoh - arrays with the broadcast shape of the inputs (see detectability)
+    """
+    diameter_m=n.asarray(diameter_m,dtype=n.float64)
+    range_m=n.asarray(range_m,dtype=n.float64)
+    if gain is None:
+        gain=r.gain
+    
+    doppler_bandwidth=4*n.pi*diameter_m/(r.wavelength*n.asarray(spin_period_s,dtype=n.float64))
+
+    # for serendipitous discovery
+    detection_bandwidth=n.maximum(doppler_bandwidth,n.maximum(1.0/r.max_coh_int_time, 1.0/t_obs))
+    
+    # for detection with a periori know orbit
+    incoh_int_bandwidth=n.maximum(doppler_bandwidth,1.0/t_obs)
+
+    p_n0 = c.k*r.noise_temp*detection_bandwidth/r.duty_cycle
+    p_n1 = c.k*r.noise_temp*incoh_int_bandwidth/r.duty_cycle
+
+    p_s=hard_target_s_n(gain, gain,
+                        r.wavelength, r.tx_pwr,
+                        range_m, range_m,
+                        diameter_m=diameter_m,
+                        radar_albedo=radar_albedo,
+                        rcs_model=rcs_model)
+
+    # same as incoh_snr_calc, without the t_epsilon term
+    snr_incoh=(p_s/p_n1)*n.sqrt(t_obs*incoh_int_bandwidth)
+    snr_coh=p_s/p_n0
+    return(snr_coh,snr_incoh)
+
+
+def detection_range(r, diameter_m,
+                    snr_threshold=10.0,
+                    spin_period_s=3600.0,
+                    radar_albedo=0.1,
+                    rcs_model="rayleigh_optical"):
+    """
+    Maximum range (m) at which an object is detected by r with coherent SNR (see detectability)
+    of at least snr_threshold. The noise bandwidth does not depend on range and the SNR is
+    proportional to range^-4, so this is closed form.
+    """
+    snr_1m,snr_incoh=detectability_batch(r,diameter_m,1.0,spin_period_s=spin_period_s,radar_albedo=radar_albedo,rcs_model=rcs_model)
+    return((snr_1m/snr_threshold)**0.25)
+
+# version of the detection range tables. tables with another version are not reused.
+range_table_version=1
+_range_tables={}
+
+def range_table(r,
+                snr_threshold=10.0,
+                spin_period_s=3600.0,
+                radar_albedo=0.1,
+                rcs_model="rayleigh_optical",
+                d_min=1e-3,
+                d_max=1e3,
+                n_d=2000):
+    """
+    Maximum detection range table for diameters logarithmically spaced between d_min and d_max.
+    returns an array with rows diameter (m) and range (m).
+
+    Tables are built on first use and stored in the cache directory, keyed on the
+    radar and the other parameters, so other processes can load them.
+    """
+    key=neo_cache.param_key("range_table",range_table_version,
+                            float(r.gain),float(r.tx_pwr),float(r.duty_cycle),float(r.wavelength),
+                            float(r.noise_temp),float(r.max_coh_int_time),
+                            float(snr_threshold),float(spin_period_s),float(radar_albedo),rcs_model,
+                            float(d_min),float(d_max),int(n_d))
+    if key in _range_tables:
+        return(_range_tables[key])
+    fname=os.path.join(neo_cache.cache_dir("range_tables"),"%s.npy"%(key))
+    if os.path.exists(fname):
+        t=n.load(fname)
+    else:
+        d=10**n.linspace(n.log10(d_min),n.log10(d_max),num=n_d)
+        t=n.array([d,detection_range(r,d,snr_threshold=snr_threshold,spin_period_s=spin_period_s,
+                                     radar_albedo=radar_albedo,rcs_model=rcs_model)])
+        neo_cache.atomic_save(fname,t)
+    _range_tables[key]=t
+    return(t)
+
+def max_range(r, diameter_m, **kwargs):
+    """
+    Maximum detection range (m) for an array of diameters (m), interpolated in log-log
+    from range_table(r, **kwargs). Diameters outside the table are evaluated directly.
+    """
+    t=range_table(r,**kwargs)
+    d=n.asarray(diameter_m,dtype=n.float64)
+    ld=n.log(t[0])
+    x=(n.log(d)-ld[0])/(ld[1]-ld[0])
+    inside=(x >= 0) & (x <= len(ld)-1)
+    idx=n.clip(x,0,len(ld)-2).astype(n.int64)
+    frac=x-idx
+    lr=n.log(t[1])
+    res=n.exp(lr[idx]+frac*(lr[idx+1]-lr[idx]))
+    if not n.all(inside):
+        kw=dict([(k,v) for k,v in kwargs.items() if k in ["snr_threshold","spin_period_s","radar_albedo","rcs_model"]])
+        res=n.where(inside,res,detection_range(r,d,**kw))
+    return(res)
+
 def check_radars():
     
     e3d=radar(gain=10**4.3,
@@ -174,93 +300,190 @@ def e3d_radar():
                  tx_pwr=5e6,
                  duty_cycle=0.25,
                  wavelength=1.3,
-                 noise_temp=150.0))
+                 noise_temp=150.0,
+                 aperture_m=80.0))
 def uhf_radar():
     return(radar(gain=10**4.8,
                  tx_pwr=1.8e6,
                  duty_cycle=0.125,
                  wavelength=0.32,
                  noise_temp=90.0))
-    
-           
-    
+
+# radar configurations by name
+radar_registry={}
+
+def register_radar(name,r):
+    radar_registry[name]=r
+
+def get_radar(name):
+    """
+    a copy of a registered radar, which can be modified without changing the registry
+    """
+    return(copy.copy(radar_registry[name]))
+
+def load_radars(fname="radars.json"):
+    """
+    Register radars from a JSON file with an object of name: parameters,
+    where the parameters are the arguments of radar().
+    returns the names in the file
+    """
+    with open(fname,"r") as f:
+        conf=json.load(f)
+    for name,p in conf.items():
+        register_radar(name,radar(**p))
+    return(list(conf.keys()))
+
+register_radar("arecibo",arecibo_radar())
+register_radar("e3d",e3d_radar())
+register_radar("uhf",uhf_radar())
+
+LD=384400e3
+
+# one ephemeris step of one catalog object. geometry does not depend on the radar.
+geometry_dtype=n.dtype([("obj","i8"),
+                        ("date","U24"),
+                        ("range","f8"),
+                        ("el","f8")])
+
+def first_pass(r,neos):
+    """
+    snr_incoh of each catalog object at its closest approach distance, with full gain
+    """
+    diams=0.5*(neos.d_min+neos.d_max)
+    snr_coh,snr_incoh=detectability_batch(r,diams,LD*neos.dist_ld,spin_period_s=5*60,radar_albedo=0.1,t_obs=3600.0)
+    return(snr_incoh)
+
+def object_name(neo):
+    return(re.search(".*\((.*)\)",neo["name"]).group(1))
+
+def geometry_table(neos,
+                   candidates,
+                   fname="cneos_closeapproach_data_past.csv",
+                   time_window=2*24*3600.0,
+                   step="1h",
+                   max_workers=8,
+                   query=neo_horizons.horizons_query,
+                   min_interval=0.2):
+    """
+    Range and elevation of catalog objects at each ephemeris step during an observing window
+    around closest approach. Rows are sorted by object index.
+
+    The table is stored in the cache directory, keyed on the catalog file, time window and step.
+    Objects that are not yet in the table are fetched and added to it, so screening more
+    radars only fetches the new candidates.
+
+    candidates - catalog indices of the objects needed
+    query, min_interval - ephemeris source and minimum time between requests (see neo_horizons.fetch_many)
+    """
+    key=neo_cache.param_key(os.path.abspath(fname),neo_cache.file_key(fname),float(time_window),step)
+    gname=os.path.join(neo_cache.cache_dir("geometry"),"%s.npy"%(key))
+    if os.path.exists(gname):
+        geom=n.load(gname)
+    else:
+        geom=n.zeros(0,dtype=geometry_dtype)
+    missing=n.setdiff1d(candidates,geom["obj"])
+    if len(missing) > 0:
+        windows=[]
+        for ni in missing:
+            timestamp = float(neos[ni]["epoch"])
+            start_t=stuffr.unix2date(timestamp-time_window).strftime('%Y-%m-%d %H:%M')
+            stop_t=stuffr.unix2date(timestamp+time_window).strftime('%Y-%m-%d %H:%M')
+            windows.append((ni,object_name(neos[ni]),start_t,stop_t))
+        rows=[geom]
+        # all steps are kept, the elevation limit is applied when evaluating a radar
+        for ni,(h_ranges,h_range_rates,h_els,h_dates) in neo_horizons.fetch_many(windows,step=step,max_workers=max_workers,min_interval=min_interval,query=query,min_el=-90.0):
+            g=n.zeros(len(h_ranges),dtype=geometry_dtype)
+            g["obj"]=ni
+            g["date"]=h_dates
+            g["range"]=h_ranges
+            g["el"]=h_els
+            rows.append(g)
+        geom=n.concatenate(rows)
+        geom=geom[n.argsort(geom["obj"],kind="stable")]
+        neo_cache.atomic_save(gname,geom)
+    return(geom[n.isin(geom["obj"],candidates)])
+
+def evaluate_geometry(r,neos,geom,planar_array=True,min_el=30.0,snr_threshold=10.0):
+    """
+    Evaluate a radar against a geometry table in one vectorized pass.
+    A planar array loses gain off zenith.
+
+    returns catalog indices of detectable objects, their maximum snr_incoh
+    and the geometry table row where the maximum is reached
+    """
+    diams=0.5*(neos.d_min+neos.d_max)
+    cand=first_pass(r,neos) > snr_threshold
+    rows=n.nonzero(cand[geom["obj"]])[0]
+    g=geom[rows]
+    if len(g) == 0:
+        return(n.zeros(0,dtype=n.int64),n.zeros(0),n.zeros(0,dtype=n.int64))
+    gain=r.gain
+    if planar_array:
+        gain=r.gain*n.sin(n.pi*g["el"]/180.0)
+    m_snr_coh,m_snr_incoh=detectability_batch(r,diams[g["obj"]],g["range"],spin_period_s=5*60,radar_albedo=0.1,gain=gain,t_obs=3600.0)
+    m_snr_incoh[g["el"] <= min_el]=0.0
+
+    # maximum of each object (rows are sorted by object)
+    objs,first,counts=n.unique(g["obj"],return_index=True,return_counts=True)
+    max_snr=n.maximum.reduceat(m_snr_incoh,first)
+    is_max=m_snr_incoh == n.repeat(max_snr,counts)
+    arg=n.minimum.reduceat(n.where(is_max,n.arange(len(g)),len(g)),first)
+    det=max_snr > snr_threshold
+    return(objs[det],max_snr[det],rows[arg[det]])
+
+def screen_radars(radars,
+                  time_window=2*24*3600.0,
+                  fname="cneos_closeapproach_data_past.csv",
+                  step="1h",
+                  max_workers=8,
+                  query=neo_horizons.horizons_query,
+                  min_interval=0.2):
+    """
+    Screen a catalog with several radars. The catalog is read once, and the geometry is fetched
+    once for the candidates of all radars (see geometry_table).
+
+    radars - list of (name, radar, planar_array)
+    returns a dict name -> (object indices, max snr_incoh, geometry rows) and the catalog and geometry table
+    """
+    neos=neo_cat.load_catalog(fname=fname)
+    cand=n.zeros(len(neos),dtype=bool)
+    for name,r,planar_array in radars:
+        cand|=first_pass(r,neos) > 10.0
+    geom=geometry_table(neos,n.nonzero(cand)[0],fname=fname,time_window=time_window,step=step,max_workers=max_workers,
+                       query=query,min_interval=min_interval)
+    res={}
+    for name,r,planar_array in radars:
+        res[name]=evaluate_geometry(r,neos,geom,planar_array=planar_array)
+    return(res,neos,geom)
+
+def print_detections(neos,geom,det):
+    objs,max_snr,rows=det
+    diams=0.5*(neos.d_min+neos.d_max)
+    for ni,snr,ri in zip(objs,max_snr,rows):
+        print("-> %s %s min_dist_ld %1.2f elevation %1.2f snr_incoh/hour %1.2f diam %1.2f m"%(object_name(neos[ni]),geom["date"][ri],geom["range"][ri]/LD,geom["el"][ri],snr,diams[ni]))
+
 def catalog_check(r,
                   planar_array=True,
                   time_window=2*24*3600.0,
                   fname="cneos_closeapproach_data_past.csv",
+                  max_workers=8,
+                  query=neo_horizons.horizons_query,
+                  min_interval=0.2,
                   debug=False):
 
     """ 
     go through catalog
     check is object can be detected at closest distance
     if yes, check using horizons if it is above horizon and at a detectable range.
+    ephemerides of the candidates are fetched using max_workers parallel requests.
+    query replaces the Horizons query, e.g., with a local stand-in.
     """
-    gain0=r.gain
-    
-    
-    
-    LD=384400e3
-    neos=neo_cat.read_neos(fname=fname)
-    det_r=[]
-    det_d=[]
-    for neo in neos:
-        diam=0.5*(neo["d_min"]+neo["d_max"])
-        o = space_object(diameter_m=diam,
-                         range_m=LD*neo["dist_ld"],
-                         spin_period_s=5*60,
-                         radar_albedo=0.1)
-        
-        snr_coh,snr_incoh=detectability(r,o, t_obs=3600.0)
-
-        name=re.search(".*\((.*)\)",neo["name"]).group(1)
-        
-        if snr_incoh > 10.0:
-            # we may have a chance. let's look at elevation and observability using a real ephemeris
-            if False:
-                print("# %s min_dist_ld %1.2f max_snr_coh %1.2f max_snr_incoh %1.2f"%(name,neo["dist_ld"],snr_coh,snr_incoh))
-
-            # I hate datetime calculations. I'm pretty sure this only works if your computer timezone is UTC
-            # this is not production code, so I'm not going to bother to figure out how to do this more
-            # generally.
-            d0=datetime.datetime.strptime("%s %s"%(neo["ymd"],neo["hour"]), "%Y-%b-%d %H:%M")
-            timestamp = (d0-datetime.datetime(1970,1,1)).total_seconds()
-            d0=stuffr.unix2date(timestamp-time_window)
-            d1=stuffr.unix2date(timestamp+time_window)
-            start_t=d0.strftime('%Y-%m-%d %H:%M')
-            stop_t=d1.strftime('%Y-%m-%d %H:%M')
-
-            # get ephemeris during an observing window around closest approach
-            h_ranges,h_range_rates,h_els,h_dates= neo_horizons.check_detectability(obj_id=name,
-                                                                                   start=start_t,
-                                                                                   stop=stop_t,
-                                                                                   step="1h")
-            
-            n_obs=len(h_ranges)
-            max_snr=0
-            min_dist=0
-            max_el=0
-            max_date=""
-            for oi in range(n_obs):
-                o.range_m=h_ranges[oi]
-                if planar_array:
-                    r.gain=gain0*n.sin(n.pi*h_els[oi]/180.0)
-                
-                m_snr_coh,m_snr_incoh=detectability(r,o, t_obs=3600.0)
-
-                if snr_incoh > 10 and h_els[oi] > 30.0:
-                    if m_snr_incoh > max_snr:
-                        max_snr=m_snr_incoh
-                        min_dist=h_ranges[oi]/LD
-                        max_el=h_els[oi]
-                        max_date=h_dates[oi]
-                        #                    print("%s dist_ld %1.2f snr_coh %1.2f snr_incoh/hour %1.2f"%(name,h_ranges[oi]/LD,m_snr_coh,m_snr_incoh))
-            if max_snr > 10.0:
-                print("-> %s %s min_dist_ld %1.2f elevation %1.2f snr_incoh/hour %1.2f diam %1.2f m"%(name,max_date,min_dist,max_el,max_snr,diam))
-            if debug:
-                print("----")
-        else:
-            if debug:
-                print("%s not observable"%(name))
+    res,neos,geom=screen_radars([("radar",r,planar_array)],time_window=time_window,fname=fname,max_workers=max_workers,
+                                query=query,min_interval=min_interval)
+    if debug:
+        for ni in n.nonzero(first_pass(r,neos) <= 10.0)[0]:
+            print("%s not observable"%(object_name(neos[ni])))
+    print_detections(neos,geom,res["radar"])
 #                    print("%s dist_ld %1.2f snr_coh %1.2f snr_incoh %1.2f diam %1.1f-%1.1f m"%(neo["name"],neo["dist_ld"],snr_coh,snr_incoh,neo["d_min"],neo["d_max"]))
 #det_r.append(neo["dist_ld"]*LD)
  #               det_d.append(0.5*(neo["d_min"]+neo["d_max"]))
@@ -276,18 +499,13 @@ def catalog_check(r,
         
 
 if __name__ == "__main__":
-    e3d=e3d_radar()
-    uhf=uhf_radar()    
-
-    print("Past year")
-    print("EISCAT UHF")
-    catalog_check(uhf,planar_array=False,fname="cneos_closeapproach_data_past.csv")
-    print("EISCAT 3D")
-    catalog_check(e3d,planar_array=True,fname="cneos_closeapproach_data_past.csv")
-    
-    print("One year into future")
-    print("EISCAT UHF")
-    catalog_check(uhf,planar_array=False,fname="cneos_closeapproach_data_future.csv")
-    print("EISCAT 3D")
-    catalog_check(e3d,planar_array=True,fname="cneos_closeapproach_data_future.csv")
-    
+    radars=[("EISCAT UHF",uhf_radar(),False),
+            ("EISCAT 3D",e3d_radar(),True)]
+
+    for title,fname in [("Past year","cneos_closeapproach_data_past.csv"),
+                        ("One year into future","cneos_closeapproach_data_future.csv")]:
+        print(title)
+        res,neos,geom=screen_radars(radars,fname=fname)
+        for name,r,planar_array in radars:
+            print(name)
+            print_detections(neos,geom,res[name])
@@ -1,16 +1,21 @@
 #!/usr/bin/env python
 
 import numpy as n
-import matplotlib.pyplot as plt
-import scipy.constants as c
 import datetime
+import calendar
 import stuffr
 import re
-import astropy.units as u
 
-from SBDBlookup import database_lookup
+from SBDBlookup import lookup_elements
 import neo_cat
+import scattering
 import neo_horizons
+import neo_schedule
+import neo_snr
+from lazy_import import lazy_module
+
+plt=lazy_module("matplotlib.pyplot")
+c=lazy_module("scipy.constants")
 
 class radar:
     def __init__(self,gain,tx_pwr,duty_cycle,wavelength,noise_temp,max_coh_int_time=0.2):
@@ -32,10 +37,11 @@ def hard_target_s_n(gain_tx, gain_rx,
                     wavelength_m, power_tx,
                     range_tx_m, range_rx_m,
                     diameter_m=0.01,
-                    radar_albedo=0.1):
+                    radar_albedo=0.1,
+                    rcs_model="rayleigh_optical"):
     '''
     Deterine the energy-to-noise ratio for a hard target (signal-to-noise ratio).
-    Assume a smooth transition between Rayleigh and optical scattering.
+    By default, assume a smooth transition between Rayleigh and optical scattering.
     
     gain_tx - transmit antenna gain, linear
     gain_rx - receiver antenna gain, linear
@@ -46,19 +52,10 @@ def hard_target_s_n(gain_tx, gain_rx,
     diameter_m - object diameter (meters)
     radar_albedo - how much is the rcs compared to the rcs of a perfectly 
                  conducting sphere. 
+    rcs_model - radar cross-section model (see scattering.models)
     '''
-    
-    ##
-    ## Determine returned signal power, given diameter of sphere
-    ## Ignore resonant regime and use either optical or rayleigh scatter.
-    ## This is essentially the same as the NASA SEM model for space
-    ## debris RCS. 
-    ##
-    is_rayleigh = diameter_m < wavelength_m/(n.pi*n.sqrt(3.0))
-    is_optical = diameter_m >= wavelength_m/(n.pi*n.sqrt(3.0))
-    rayleigh_power = (9.0*power_tx*(((gain_tx*gain_rx)*(n.pi**2.0)*(diameter_m**6.0))/(256.0*(wavelength_m**2.0)*(range_rx_m**2.0*range_tx_m**2.0))))
-    optical_power = (power_tx*(((gain_tx*gain_rx)*(wavelength_m**2.0)*(diameter_m**2.0)))/(256.0*(n.pi**2)*(range_rx_m**2.0*range_tx_m**2.0)))
-    return(   ((is_rayleigh)*rayleigh_power + (is_optical)*optical_power)*radar_albedo ) 
+    sigma=scattering.rcs(diameter_m,wavelength_m,model=rcs_model)
+    return(power_tx*gain_tx*gain_rx*wavelength_m**2.0*sigma*radar_albedo/((4.0*n.pi)**3.0*range_rx_m**2.0*range_tx_m**2.0))
 
 def incoh_snr_calc(p_s, p_n, epsilon=0.05, B=10.0, t_incoh=3600.0):
     """
@@ -190,25 +187,33 @@ def catalog_check(r,
                   planar_array=True,
                   time_window=2*24*3600.0,
                   fname="cneos_closeapproach_data_past.csv",
+                  max_workers=8,
+                  query=neo_horizons.horizons_query,
+                  min_interval=0.2,
                   debug=False):
 
     """ 
     go through catalog
     check is object can be detected at closest distance
     if yes, check using horizons if it is above horizon and at a detectable range.
+    ephemerides of the candidates are fetched using max_workers parallel requests.
+    query replaces the Horizons query, e.g., with neo_horizons.synthetic_query.
     """
-    gain0=r.gain
     
     usable_list = []
+    usable_idx = []
     counter = 0
     LD=384400e3
-    neos=neo_cat.read_neos(fname=fname)
+    neos=neo_cat.load_catalog(fname=fname)
     det_r=[]
     det_d=[]
     obs_time_times = []
 
     n_detectable=0
-    for neo in neos:
+    windows=[]
+    # observable windows of each object, for resolving conflicts between objects
+    obs_windows=[]
+    for ni,neo in enumerate(neos):
 
         o = space_object(diameter_m=0.5*(neo["d_min"]+neo["d_max"]),
                          range_m=LD*neo["dist_ld"],
@@ -219,74 +224,89 @@ def catalog_check(r,
 
         name=re.search(".*\((.*)\)",neo["name"]).group(1)
 
-        serendipitously_discoverable = []
-
-
-        
         if snr_incoh > 10.0:
             # we may have a chance. let's look at elevation and observability using a real ephemeris
             if False:
                 print("# %s min_dist_ld %1.2f max_snr_coh %1.2f max_snr_incoh %1.2f"%(name,neo["dist_ld"],snr_coh,snr_incoh))
 
-            # I hate datetime calculations. I'm pretty sure this only works if your computer timezone is UTC
-            # this is not production code, so I'm not going to bother to figure out how to do this more
-            # generally.
-            d0=datetime.datetime.strptime("%s %s"%(neo["ymd"],neo["hour"]), "%Y-%b-%d %H:%M")
-            timestamp = (d0-datetime.datetime(1970,1,1)).total_seconds()
+            timestamp = float(neo["epoch"])
             d0=stuffr.unix2date(timestamp-time_window)
             d1=stuffr.unix2date(timestamp+time_window)
             start_t=d0.strftime('%Y-%m-%d %H:%M')
             stop_t=d1.strftime('%Y-%m-%d %H:%M')
-
-            # get ephemeris during an observing window around closest approach
-            h_ranges,h_range_rates,h_els,h_dates= neo_horizons.check_detectability(obj_id=name,
-                                                                                   start=start_t,
-                                                                                   stop=stop_t,
-                                                                                   step="5m")
-            obs_time = []
-            n_obs=len(h_ranges)
-            coh_max = 0
-            max_snr=0
-            min_dist=0
-            max_el=0
-            max_date=""
-            total_obs_time=0.0
-            total_s_obs_time=0.0            
-            for oi in range(n_obs):
-                o.range_m=h_ranges[oi]
-                if planar_array:
-                    r.gain=gain0*n.sin(n.pi*h_els[oi]/180.0)
-                
-                m_snr_coh,m_snr_incoh=detectability(r,o, t_obs=3600.0)
-
-                if snr_incoh > 10:
-                    total_obs_time+=5.0
-                    if m_snr_incoh > max_snr:
-                        max_snr=m_snr_incoh
-                        min_dist=h_ranges[oi]/LD
-                        max_el=h_els[oi]
-                        max_date=h_dates[oi]
-                        #                    print("%s dist_ld %1.2f snr_coh %1.2f snr_incoh/hour %1.2f"%(name,h_ranges[oi]/LD,m_snr_coh,m_snr_incoh))
-                    obs_time.append(h_dates[oi])
-                if m_snr_coh > 10.0:
-                    coh_max=m_snr_coh
-                    total_s_obs_time+=5.0
-            if max_snr > 10.0:
-                n_detectable+=1
-                print("%d -> %s %s min_dist_ld %1.2f elevation %1.2f snr_coh %1.2f snr_incoh/hour %1.2f obs_time %1.2f (min) coh_obs_time %1.2f (min)"%(n_detectable,name,max_date,min_dist,max_el,coh_max,max_snr,total_obs_time,total_s_obs_time))
-                counter +=1
-                usable_list.append([name, max_date, min_dist, max_el, max_snr,neo["d_max"]]) #saves the observable ones
-                
-                obs_time_times.append(obs_time)
-            if debug:
-                print("----")
+            windows.append((ni,name,start_t,stop_t))
         else:
             if debug:
                 print("%s not observable"%(name))
+
+    # get ephemeris during an observing window around closest approach.
+    # requests run in parallel, and each result is evaluated as it arrives.
+    # the report is made in catalog order afterwards, so it does not depend on request timing.
+    evaluated={}
+    for ni,(h_ranges,h_range_rates,h_els,h_dates) in neo_horizons.fetch_many(windows,step="5m",max_workers=max_workers,
+                                                                            min_interval=min_interval,query=query):
+        neo=neos[ni]
+        name=re.search(".*\((.*)\)",neo["name"]).group(1)
+        o = space_object(diameter_m=0.5*(neo["d_min"]+neo["d_max"]),
+                         range_m=LD*neo["dist_ld"],
+                         spin_period_s=60*60*0.005*0.5*(neo["d_min"]+neo["d_max"]),
+                         radar_albedo=0.1)
+
+        n_obs=len(h_ranges)
+        obs_time=list(h_dates)
+        # SNR of all ephemeris steps at once. a planar array loses gain off zenith.
+        gain=r.gain*n.sin(n.pi*n.asarray(h_els)/180.0) if planar_array else r.gain
+        m_snr_coh,step_snr=neo_snr.detectability_batch(r,o.diameter_m,h_ranges,
+                                                       spin_period_s=o.spin_period_s,
+                                                       radar_albedo=o.radar_albedo,
+                                                       gain=gain,
+                                                       t_obs=3600.0)
+        total_obs_time=5.0*n_obs
+        coh=m_snr_coh > 10.0
+        total_s_obs_time=5.0*n.sum(coh)
+        coh_max=m_snr_coh[coh][-1] if n.any(coh) else 0
+        max_snr=0
+        min_dist=0
+        max_el=0
+        max_date=""
+        if n_obs > 0 and n.max(step_snr) > 0:
+            oi=n.argmax(step_snr)
+            max_snr=step_snr[oi]
+            min_dist=h_ranges[oi]/LD
+            max_el=h_els[oi]
+            max_date=h_dates[oi]
+        window=None
+        if n_obs > 0:
+            step_t=n.array([calendar.timegm(datetime.datetime.strptime(d.strip(),'%Y-%b-%d %H:%M').timetuple()) for d in h_dates])
+            window=neo_schedule.windows_from_series(ni,step_t,step_snr > 10.0,step_snr,dt=300.0)
+        evaluated[ni]=(name,max_date,min_dist,max_el,coh_max,max_snr,total_obs_time,total_s_obs_time,obs_time,window)
+
+    for ni in sorted(evaluated):
+        name,max_date,min_dist,max_el,coh_max,max_snr,total_obs_time,total_s_obs_time,obs_time,window=evaluated[ni]
+        neo=neos[ni]
+        if window is not None:
+            obs_windows.append(window)
+        if max_snr > 10.0:
+            n_detectable+=1
+            print("%d -> %s %s min_dist_ld %1.2f elevation %1.2f snr_coh %1.2f snr_incoh/hour %1.2f obs_time %1.2f (min) coh_obs_time %1.2f (min)"%(n_detectable,name,max_date,min_dist,max_el,coh_max,max_snr,total_obs_time,total_s_obs_time))
+            counter +=1
+            usable_list.append([name, max_date, min_dist, max_el, max_snr,neo["d_max"]]) #saves the observable ones
+            usable_idx.append(ni)
+            
+            obs_time_times.append(obs_time)
+        if debug:
+            print("----")
     print(counter)
 
     print(len(obs_time_times), len(obs_time_times[0]))
 
+    # one radar can only observe one object at a time
+    obs_windows=neo_schedule.merge_windows(obs_windows)
+    sel,track_t0=neo_schedule.greedy_schedule(obs_windows,track_len=1800.0,slew_time=60.0)
+    print("%d of %d objects can be tracked for 30 minutes without conflicts"%(len(sel),len(n.unique(obs_windows["obj"]))))
+    sel=neo_schedule.weighted_schedule(obs_windows,slew_time=60.0,one_per_object=True)
+    print("observing whole windows, one per object, %d objects with integrated snr %1.3g"%(len(sel),n.sum(obs_windows["weight"][sel])))
+
 
     object_observability_durations = []
     for time in obs_time_times:
@@ -298,13 +318,14 @@ def catalog_check(r,
     diameters = []
     snrs = []
     dates = []
-    elements = []
     for i in range(len(usable_list)):
         ranges.append(usable_list[i][2])
         snrs.append(usable_list[i][4])
         diameters.append(usable_list[i][5])
         dates.append(usable_list[i][1])
-        elements.append(database_lookup(usable_list[i][0]))
+    # one bulk lookup for the observable objects and the whole catalog
+    elements = lookup_elements(neos.name[usable_idx])
+    element_vector = lookup_elements(neos.name)
     #plt.plot(ranges, diameters,'.')
     #plt.grid()
     #plt.title("Diameter as a function of range of observable NEOs")
@@ -339,48 +360,16 @@ def catalog_check(r,
     plt.plot(range(1,13), terrible_implementation, '.')
     plt.show()
 
-    eccentricity = []
-    semi_axis = []
-    inclination = []
-    peri_arg = []
-
-    eccentricity2 = []
-    semi_axis2 = []
-    inclination2 = []
-    peri_arg2 = []
-
-    for element in elements:
-        eccentricity.append(float(element['e']))
-        semi_axis.append(element['a'].to(u.m)/149597870700.0)
-        inclination.append(element['i'].to(u.rad))
-        peri_arg.append(element['w'].to(u.rad))
-
-    element_vector = []
-    diams = []
-    for neo in neos:
-        diams.append(0.5*neo["d_min"]+0.5*neo["d_max"])
-        name = neo["name"]
-        if name != "66391 Moshup (1999 KW4)":
-            element_vector.append(database_lookup(name.replace("(","").replace(")","")))
-        if name == "66391 Moshup (1999 KW4)":
-            name = "66391 Moshup"
-            element_vector.append(database_lookup(name.replace("(","").replace(")","")))
-
-    eccentricity = n.array(eccentricity)
-    semi_axis = n.array(semi_axis)
-    inclination = n.array(inclination)
-    peri_arg = n.array(peri_arg)
-
-    for element in element_vector:
-        eccentricity2.append(float(element['e']))
-        semi_axis2.append(element['a'].to(u.m)/149597870700.0)
-        inclination2.append(element['i'].to(u.rad))
-        peri_arg2.append(element['w'].to(u.rad))
-
-    eccentricity2 = n.array(eccentricity2)
-    semi_axis2 = n.array(semi_axis2)
-    inclination2 = n.array(inclination2)
-    peri_arg2 = n.array(peri_arg2)
+    eccentricity = elements.e
+    semi_axis = elements.a
+    inclination = n.radians(elements.i)
+    peri_arg = n.radians(elements.w)
+
+    diams = 0.5*neos.d_min+0.5*neos.d_max
+    eccentricity2 = element_vector.e
+    semi_axis2 = element_vector.a
+    inclination2 = n.radians(element_vector.i)
+    peri_arg2 = n.radians(element_vector.w)
 
     plt.rcParams.update({'font.size':16})
     plt.rcParams["figure.figsize"] = (30,10)
@@ -1,84 +1,110 @@
 #!/usr/bin/env python
+'''Compare radars for serendipitous NEO detection.
 
-import numpy as n
-import matplotlib.pyplot as plt
-import scipy.constants as c
+All radars are evaluated against a diameter grid in one broadcast
+computation. Radars are neo_snr.radar instances or names in the radar
+registry (neo_snr.register_radar, neo_snr.load_radars).
+'''
 
-ao_gain=4*n.pi*0.38*n.pi*(305/2.0)**2.0/0.126**2.0
-ao_lam=3e8/2.38e9
-ao_diam=n.sqrt(ao_gain*ao_lam**2.0/(n.pi**2.0*0.38))
-print(ao_diam)
-ao={"lam":ao_lam,"D":n.sqrt(ao_gain*ao_lam**2.0/(n.pi**2.0*0.38)),"G":ao_gain,"P":0.9e6,"Tsys":23.0}
-dss14={"lam":3e8/8.56e9,"D":70.0,"G":4*n.pi*0.64*n.pi*(70.0/2.0)**2.0/0.035**2.0,"P":0.45e6,"Tsys":18.0}
-e3d={"lam":1.3,"G":10**4.3,"D":80.0,"P":5e6*0.25,"Tsys":150.0}
-euhf={"lam":0.32,"G":10**4.8,"D":32.0,"P":1.8e6*0.125,"Tsys":70.0}
+import numpy as n
 
+import neo_snr
+import scattering
+from lazy_import import lazy_module
+
+c=lazy_module("scipy.constants")
+
+def radar_params(radars):
+    '''
+    radars and their parameters as arrays of shape (n_radar,1), for broadcasting against diameters
+    '''
+    rs=[neo_snr.get_radar(r) if isinstance(r,str) else r for r in radars]
+    p={}
+    for k in ["gain","tx_pwr","duty_cycle","wavelength","noise_temp"]:
+        p[k]=n.array([getattr(r,k) for r in rs],dtype=n.float64)[:,None]
+    p["aperture_m"]=n.array([r.aperture() for r in rs],dtype=n.float64)[:,None]
+    # average transmit power
+    p["P"]=p["tx_pwr"]*p["duty_cycle"]
+    return(p)
+
+def figure_of_merit(radars):
+    '''
+    P G^2 lambda^(5/2) / T_sys, proportional to the detection rate of a beam-park search.
+    '''
+    p=radar_params(radars)
+    return((p["P"]*p["gain"]**2.0*p["wavelength"]**(5/2.0)/p["noise_temp"])[:,0])
 
 def comp(r0,r1):
-    g0=r0["P"]*r0["G"]**2.0*r0["lam"]**(5/2.0)/r0["Tsys"]
-    g1=r1["P"]*r1["G"]**2.0*r1["lam"]**(5/2.0)/r1["Tsys"]
-
-    return(g0/g1)
-
-def range_area(r,D=n.linspace(0.26,10,num=100),B=5.0):
+    '''
+    figure of merit of r0 relative to r1
+    '''
+    m=figure_of_merit([r0,r1])
+    return(m[0]/m[1])
+
+def detection_range(radars,D,B=5.0,snr=10.0,radar_albedo=0.1,rcs_model="rayleigh_optical"):
+    '''
+    range (m) where an object of diameter D is detected with signal to noise ratio snr,
+    for a noise bandwidth of B Hz. shape (n_radar,n_D)
+    '''
+    p=radar_params(radars)
+    sigma=scattering.rcs(n.asarray(D,dtype=n.float64)[None,:],p["wavelength"],model=rcs_model)
+    return(((p["P"]*p["gain"]**2.0*p["wavelength"]**2.0*radar_albedo*sigma)/(snr*(4*n.pi)**3.0*c.k*p["noise_temp"]*B))**(1/4.0))
+
+def range_area(radars,D=n.linspace(0.26,10,num=100),B=5.0,snr=10.0):
+    '''
+    search cross-section area (m^2) of the beam up to the detection range. shape (n_radar,n_D)
+    '''
+    p=radar_params(radars)
     # beam opening angle
-    alpha=r["lam"]/r["D"]
-    R10=((r["P"]*r["G"]**2.0*r["lam"]**2.0*0.1*(1.0/4.0)*n.pi*D**2.0)/(10*(4*n.pi)**3.0*c.k*r["Tsys"]*B))**(1/4.0)
-    A_cs=0.5*R10**2.0*alpha
-    return(A_cs,D)
+    alpha=p["wavelength"]/p["aperture_m"]
+    R=detection_range(radars,D,B=B,snr=snr)
+    return(0.5*R**2.0*alpha,D)
 
 def neo_flux(D):
     """ flux per m^2 """
     A_e=n.pi*6480e3**2.0
     return(99.854*D**(-3.7)/A_e)
 
-D=n.linspace(0.26,10,num=100)    
-A_ao,d=range_area(ao,D)
-A_e3d,d=range_area(e3d,D)
-A_uhf,d=range_area(euhf,D)
-A_dss14,d=range_area(dss14,D)
-flux=neo_flux(D)
-
-plt.loglog(d,A_ao,label="Arecibo")
-
-A_ao1 = D*(n.pi/32.0)*n.sqrt(0.1/(c.k*50.0))*n.sqrt(0.9e6*1.0/23.0)*0.38*305.122
-
-plt.loglog(d,A_ao1,label="Arecibo 1")
-#plt.loglog(d,A_dss14,label="Goldstone DSS14")
-#plt.loglog(d,A_e3d,label="E3D")
-#plt.loglog(d,A_uhf,label="UHF")
-plt.ylabel("Beam search cross-section area")
-plt.xlabel("Object diameter ($m$)")
-plt.title("Search cross-section areas")
-plt.legend()
-plt.show()
-
-
-plt.loglog(d,flux*A_ao,label="Arecibo")
-plt.loglog(d,flux*A_dss14,label="Goldstone DSS14")
-plt.loglog(d,flux*A_e3d,label="E3D")
-plt.loglog(d,flux*A_uhf,label="UHF")
-plt.ylabel("Detections per year / m")
-plt.xlabel("Object diameter ($m$)")
-plt.title("Detected object flux density")
-plt.legend()
-plt.show()
-
-
-
-print(comp(ao,ao))
-print(comp(ao,dss14))
-print(comp(ao,e3d))
-print(comp(ao,euhf))
-
-
-print(comp(dss14,ao))
-print(comp(dss14,dss14))
-print(comp(dss14,e3d))
-print(comp(dss14,euhf))
-
-
-#print(comp(e3d,euhf))
-    
-
-
+def compare(radars,D=n.linspace(0.26,10,num=100),B=5.0,snr=10.0):
+    '''
+    Comparison table of radars over a diameter grid.
+
+    returns a dict with radar names, diameters D, figure of merit, figure of merit relative
+    to each other radar (n_radar,n_radar), detection range, search cross-section area and
+    detected flux density (detections per year per m of diameter), each (n_radar,n_D)
+    '''
+    D=n.asarray(D,dtype=n.float64)
+    merit=figure_of_merit(radars)
+    A_cs,D=range_area(radars,D,B=B,snr=snr)
+    return({"names":[r if isinstance(r,str) else "radar%d"%(i) for i,r in enumerate(radars)],
+            "D":D,
+            "merit":merit,
+            "relative_merit":merit[:,None]/merit[None,:],
+            "range":detection_range(radars,D,B=B,snr=snr),
+            "area":A_cs,
+            "flux":neo_flux(D)[None,:]*A_cs})
+
+def plot_comparison(t):
+    import matplotlib.pyplot as plt
+    for i,name in enumerate(t["names"]):
+        plt.loglog(t["D"],t["area"][i],label=name)
+    plt.ylabel("Beam search cross-section area")
+    plt.xlabel("Object diameter ($m$)")
+    plt.title("Search cross-section areas")
+    plt.legend()
+    plt.show()
+
+    for i,name in enumerate(t["names"]):
+        plt.loglog(t["D"],t["flux"][i],label=name)
+    plt.ylabel("Detections per year / m")
+    plt.xlabel("Object diameter ($m$)")
+    plt.title("Detected object flux density")
+    plt.legend()
+    plt.show()
+
+if __name__ == "__main__":
+    neo_snr.load_radars("radars.json")
+    t=compare(["ao","dss14","e3d","euhf"])
+    plot_comparison(t)
+    for i,name in enumerate(t["names"]):
+        print(name," ".join(["%s %1.3g"%(t["names"][j],t["relative_merit"][i,j]) for j in range(len(t["names"]))]))
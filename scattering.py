@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+'''Radar cross-section models of hard targets.
+
+Monostatic radar cross-section (m^2) of a sphere of diameter d at
+wavelength lambda, from a registry of models:
+
+rayleigh_optical - Rayleigh scattering below d=lambda/(pi*sqrt(3)) and
+                   optical scattering above it, where the two are equal.
+mie - perfectly conducting sphere (Mie series), tabulated as a function
+      of ka=pi*d/lambda and interpolated. Rayleigh and optical limits
+      outside the table.
+sem - Rayleigh and optical regimes joined in the resonance region
+      (0.12 < d/lambda < 1.03) with a power law, a smooth approximation
+      of the NASA Size Estimation Model curve.
+
+A model is a function f(d,wavelength,out) which writes the cross-section
+into the preallocated array out. Each element is evaluated with the
+branch it needs only.
+'''
+
+import numpy as n
+from lazy_import import lazy_module
+
+special=lazy_module("scipy.special")
+
+models={}
+
+def register_model(name,fun):
+    models[name]=fun
+
+def rcs(diameter_m,wavelength_m,model="rayleigh_optical",out=None):
+    '''
+    Radar cross-section (m^2) of a sphere. Arguments are broadcast against each other.
+    out - optional preallocated float64 array with the broadcast shape
+    '''
+    d,wl=n.broadcast_arrays(n.asarray(diameter_m,dtype=n.float64),n.asarray(wavelength_m,dtype=n.float64))
+    if out is None:
+        out=n.empty(d.shape,dtype=n.float64)
+    models[model](d,wl,out)
+    if out.ndim == 0:
+        return(out[()])
+    return(out)
+
+def rayleigh_rcs(d,wl):
+    return(9.0*n.pi**5.0*d**6.0/(4.0*wl**4.0))
+
+def optical_rcs(d):
+    return(n.pi*d**2.0/4.0)
+
+def rayleigh_optical(d,wl,out):
+    is_rayleigh=d < wl/(n.pi*n.sqrt(3.0))
+    out[is_rayleigh]=rayleigh_rcs(d[is_rayleigh],wl[is_rayleigh])
+    is_optical=n.logical_not(is_rayleigh)
+    out[is_optical]=optical_rcs(d[is_optical])
+
+def mie_backscatter_efficiency(x):
+    '''
+    Backscatter efficiency sigma/(pi a^2) of a perfectly conducting sphere,
+    with x=ka the size parameter (Bohren and Huffman, 1983).
+    '''
+    x=n.atleast_1d(n.asarray(x,dtype=n.float64))
+    # number of terms needed for each x (Wiscombe, 1980)
+    n_max=x+4.0*x**(1.0/3.0)+2.0
+    nn=n.arange(1,int(n.max(n_max))+1)[:,None]
+    use=nn <= n_max
+    with n.errstate(all="ignore"):
+        jn=special.spherical_jn(nn,x)
+        djn=special.spherical_jn(nn,x,derivative=True)
+        hn=jn+1j*special.spherical_yn(nn,x)
+        dhn=djn+1j*special.spherical_yn(nn,x,derivative=True)
+        # a_n = [x j_n]'/[x h_n]', b_n = j_n/h_n
+        a=(jn+x*djn)/(hn+x*dhn)
+        b=jn/hn
+    s=n.sum(n.where(use,(2.0*nn+1.0)*(-1.0)**nn*(a-b),0.0),axis=0)
+    return(n.abs(s)**2.0/x**2.0)
+
+class mie_table:
+    '''
+    Backscatter efficiency on a logarithmic grid of ka, with linear interpolation.
+    The grid is uniform in log(ka), so the interpolation index is computed directly.
+    '''
+    def __init__(self,x_min=0.05,x_max=60.0,n_points=4096):
+        self.lx0=n.log(x_min)
+        self.dlx=(n.log(x_max)-self.lx0)/(n_points-1)
+        self.x_min=x_min
+        self.x_max=x_max
+        self.q=mie_backscatter_efficiency(n.exp(self.lx0+self.dlx*n.arange(n_points)))
+        self.dq=n.diff(self.q)
+
+    def __call__(self,d,wl,out):
+        x=n.pi*d/wl
+        is_rayleigh=x < self.x_min
+        is_optical=x >= self.x_max
+        out[is_rayleigh]=rayleigh_rcs(d[is_rayleigh],wl[is_rayleigh])
+        out[is_optical]=optical_rcs(d[is_optical])
+        is_mie=n.logical_not(is_rayleigh | is_optical)
+        u=(n.log(x[is_mie])-self.lx0)/self.dlx
+        idx=n.minimum(u.astype(n.int64),len(self.dq)-1)
+        u-=idx
+        out[is_mie]=(self.q[idx]+u*self.dq[idx])*optical_rcs(d[is_mie])
+
+_mie=None
+
+def mie(d,wl,out):
+    # the table is computed on first use
+    global _mie
+    if _mie is None:
+        _mie=mie_table()
+    _mie(d,wl,out)
+
+def sem(d,wl,out,x_rayleigh=0.12,x_optical=1.03):
+    x=d/wl
+    is_rayleigh=x < x_rayleigh
+    is_optical=x > x_optical
+    out[is_rayleigh]=rayleigh_rcs(d[is_rayleigh],wl[is_rayleigh])
+    out[is_optical]=optical_rcs(d[is_optical])
+    # power law in sigma/lambda^2 between the regime boundaries
+    s0=9.0*n.pi**5.0*x_rayleigh**6.0/4.0
+    s1=n.pi*x_optical**2.0/4.0
+    p=n.log(s1/s0)/n.log(x_optical/x_rayleigh)
+    is_res=n.logical_not(is_rayleigh | is_optical)
+    out[is_res]=s0*(x[is_res]/x_rayleigh)**p*wl[is_res]**2.0
+
+register_model("rayleigh_optical",rayleigh_optical)
+register_model("mie",mie)
+register_model("sem",sem)
@@ -1,16 +1,20 @@
 #!/usr/bin/env python
 
 import numpy as n
-import matplotlib.pyplot as plt
-import h5py 
-import scipy.interpolate as sio
+import neo_snr
+from lazy_import import lazy_module
 
-h=h5py.File("snr_10_diam_e3d.h5","r")
-a=n.copy(h["diam_m"].value)
-r=n.copy(h["range_m"].value)
+plt=lazy_module("matplotlib.pyplot")
 
-rfun = sio.interp1d(a,r)
 LD=384400e3
+# cross-section of the Earth for the impact flux (m^2)
+earth_cross_section=n.pi*6470e3**2.0
+
+def rfun(d):
+    """
+    Maximum detection range (m) of E3D as a function of diameter (m), for SNR=10.
+    """
+    return(neo_snr.max_range(neo_snr.e3d_radar(),d,snr_threshold=10.0))
 
 
 def plot_max_range(D=n.linspace(0.02,100.0,num=100000)):
@@ -19,8 +23,6 @@ def plot_max_range(D=n.linspace(0.02,100.0,num=100000)):
     plt.ylabel("Maximum range of detection (LD)")
     plt.show()
 
-plot_max_range()
-
 
 def neo_cumulative_flux(d):
     #(10**(1.568-2.7*n.log10(d)))
@@ -31,7 +33,7 @@ def neo_density(d):
 
 def plot_neo_flux():
     d=10**n.linspace(-2,2,num=100)
-    plt.loglog(d,neo_diam_flux(d))
+    plt.loglog(d,neo_cumulative_flux(d))
     plt.xlabel("Diameter (m)")
     plt.ylabel("Cumulative number of objects colliding with Earth per year")
     plt.tight_layout()
@@ -44,7 +46,7 @@ def e3d_count():
     R=rfun(d)
     
     A_e3d = 0.5*R**2.0*n.pi/180.0
-    A_fb=n.pi*6470e3**2.0
+    A_fb=earth_cross_section
 
 
 
@@ -73,9 +75,9 @@ def e3d_count():
     plt.xlabel("Diameter (m)")
             
     plt.show()
-    
-#plot_neo_flux()    
-e3d_count()
 
-    
+if __name__ == "__main__":
+    plot_max_range()
+    #plot_neo_flux()
+    e3d_count()
 
@@ -6,17 +6,21 @@
 #
 import numpy
 import math
-import matplotlib
-import matplotlib.cbook
-import matplotlib.pyplot as plt
 import datetime
 import time, re
 import pickle
-import h5py
+import os
+import hashlib
+import threading
+import collections
+import functools
 
+from lazy_import import lazy_module
+
+plt = lazy_module("matplotlib.pyplot")
+h5py = lazy_module("h5py")
 # fit_velocity
-import scipy.constants
-import scipy.optimize
+constants = lazy_module("scipy.constants")
 
 # xpath-like access to nested dictionaries
 # @d ditct
@@ -46,50 +50,182 @@ def periodic_convolution_matrix(envelope,rmin=0,rmax=100):
     # we imply that the number of measurements is equal to the number of elements in code
     L = len(envelope)
     ridx = numpy.arange(rmin,rmax)
-    A = numpy.zeros([L,rmax-rmin],dtype=numpy.complex64)
-    for i in numpy.arange(L):
-        A[i,:] = envelope[(i-ridx)%L]
+    A = numpy.array(envelope[(numpy.arange(L)[:,None]-ridx[None,:])%L],dtype=numpy.complex64)
     result = {}
     result['A'] = A
     result['ridx'] = ridx
     return(result)
 
-def analyze_prc_file(fname="data-000001.gdf",clen=10000,station=0,Nranges=1000):
-    z = numpy.fromfile(fname,dtype=numpy.complex64)
+# least-squares range estimator for a periodic code, using FFTs instead of the
+# dense convolution matrix. A^H z is the circular cross-correlation of the code and the
+# measurement, and A^H A is a Toeplitz matrix given by the code autocorrelation function.
+# when all L range gates are estimated, A is circulant and the estimate is a spectral division.
+def create_fft_estimator(code,rmin=0,rmax=1000):
+    L = len(code)
+    ridx = numpy.arange(rmin,rmax)
+    C = numpy.fft.fft(code)
+    result = {}
+    result['ridx'] = ridx
+    result['L'] = L
+    if len(ridx) == L and rmin%L == 0:
+        result['Cinv'] = 1.0/C
+        result['Ginv'] = None
+    else:
+        # acf[m] = sum_i conj(code[i])*code[i+m]
+        acf = numpy.fft.ifft(numpy.abs(C)**2.0)
+        G = acf[(ridx[:,None]-ridx[None,:])%L]
+        result['Cconj'] = numpy.conj(C)
+        result['Ginv'] = numpy.linalg.inv(G)
+    return(result)
+
+# estimate range gates from one or many code periods z [...,L] using create_fft_estimator
+def fft_deconvolve(z,est):
+    Z = numpy.fft.fft(z,axis=-1)
+    if est['Ginv'] is None:
+        return(numpy.array(numpy.roll(numpy.fft.ifft(Z*est['Cinv'],axis=-1),-est['ridx'][0],axis=-1),dtype=numpy.complex64))
+    xc = numpy.fft.ifft(Z*est['Cconj'],axis=-1)[...,est['ridx']%est['L']]
+    return(numpy.array(numpy.dot(xc,numpy.transpose(est['Ginv'])),dtype=numpy.complex64))
+
+# decode blocks of code periods from a raw complex64 voltage file.
+# the file is memory mapped, so only one block is in memory at a time.
+# yields (index of first period, decoded block [n_periods,Nranges])
+# method is "fft" (create_fft_estimator) or "matrix" (dense estimation matrix, reference)
+def prc_blocks(fname="data-000001.gdf",clen=10000,station=0,Nranges=1000,block_size=100,method="fft"):
+    z = numpy.memmap(fname,dtype=numpy.complex64,mode="r")
     code = create_pseudo_random_code(len=clen,seed=station)
-    N = len(z)/clen
-    res = numpy.zeros([N,Nranges],dtype=numpy.complex64)
-    idx = numpy.arange(clen)
-    r = create_estimation_matrix(code=code,cache=True)
-    B = r['B']
-    spec = numpy.zeros([N,Nranges],dtype=numpy.float32)
-
-    for i in numpy.arange(N):
-        res[i,:] = numpy.dot(B,z[idx + i*clen])
-    for i in numpy.arange(Nranges):
-        spec[:,i] = numpy.abs(numpy.fft.fft(res[:,i]))
-    r['res'] = res
-    r['spec'] = spec
+    N = len(z)//clen
+    if method == "fft":
+        est = create_fft_estimator(code,rmax=Nranges)
+        decode = lambda zb: fft_deconvolve(zb,est)
+    else:
+        r = create_estimation_matrix(code=code,rmax=Nranges,cache=True)
+        BT = numpy.ascontiguousarray(numpy.transpose(r['B']))
+        decode = lambda zb: numpy.dot(zb,BT)
+    for i0 in range(0,N,block_size):
+        i1 = min(i0+block_size,N)
+        zb = numpy.reshape(z[(i0*clen):(i1*clen)],[i1-i0,clen])
+        yield(i0,decode(zb))
+
+# decode a pseudo-random code transmission and calculate the Doppler spectrum of each range gate.
+# if out_fname is given, the decoded echoes (res) and spectra (spec) are written to an hdf5 file
+# incrementally. the Doppler spectra are calculated over as many range gates at a time as fit in
+# spec_budget bytes, or, if coh_len is given, over blocks of coh_len code periods, so that memory
+# use does not depend on file size. range_chunk is the hdf5 chunk width in range gates.
+# if out_fname is None, res and spec are returned and the whole file is held in memory.
+def analyze_prc_file(fname="data-000001.gdf",clen=10000,station=0,Nranges=1000,block_size=100,out_fname=None,range_chunk=64,method="fft",spec_budget=2**28,coh_len=None):
+    N = int(numpy.memmap(fname,dtype=numpy.complex64,mode="r").shape[0]//clen)
+    code = create_pseudo_random_code(len=clen,seed=station)
+    if method == "fft":
+        r = {'ridx':numpy.arange(Nranges)}
+    else:
+        # copy, results must not be added to the cached estimator
+        r = dict(create_estimation_matrix(code=code,rmax=Nranges,cache=True))
+
+    if out_fname == None:
+        res = numpy.zeros([N,Nranges],dtype=numpy.complex64)
+        for i0,rb in prc_blocks(fname,clen=clen,station=station,Nranges=Nranges,block_size=block_size,method=method):
+            res[i0:(i0+rb.shape[0]),:] = rb
+        r['res'] = res
+        r['spec'] = numpy.array(numpy.abs(numpy.fft.fft(res,axis=0)),dtype=numpy.float32)
+        return(r)
+
+    h = h5py.File(out_fname,"w")
+    res = h.create_dataset("res",shape=(N,Nranges),dtype=numpy.complex64,
+                           chunks=(max(1,min(block_size,N)),min(range_chunk,Nranges)))
+    spec = h.create_dataset("spec",shape=(N,Nranges),dtype=numpy.float32,
+                            chunks=(max(1,min(block_size,N)),min(range_chunk,Nranges)))
+    h["ridx"] = r['ridx']
+    h.attrs["clen"] = clen
+    h.attrs["station"] = station
+    for i0,rb in prc_blocks(fname,clen=clen,station=station,Nranges=Nranges,block_size=block_size,method=method):
+        res[i0:(i0+rb.shape[0]),:] = rb
+    if coh_len == None:
+        # the Doppler spectrum needs all periods of a range gate, so it is done over a few range gates at a time.
+        # about 32 bytes per sample: complex64 input, complex128 transform and float64 magnitude
+        spec_chunk = max(1,int(spec_budget//(32*N)))
+        for j0 in range(0,Nranges,spec_chunk):
+            j1 = min(j0+spec_chunk,Nranges)
+            spec[:,j0:j1] = numpy.abs(numpy.fft.fft(res[:,j0:j1],axis=0))
+    else:
+        # coherent integration over coh_len periods, all range gates of one block at a time
+        for i0 in range(0,N,coh_len):
+            i1 = min(i0+coh_len,N)
+            spec[i0:i1,:] = numpy.abs(numpy.fft.fft(res[i0:i1,:],axis=0))
+    h.close()
+    r['out_fname'] = out_fname
     return(r)
 
-B_cache = 0
-r_cache = 0
-B_cached = False
-def create_estimation_matrix(code,rmin=0,rmax=1000,cache=True):
-    global B_cache
-    global r_cache
-    global B_cached
+# bounded least-recently-used cache of estimators, keyed on a hash of the code and the range window.
+# thread-safe. if persist_dir is given, estimators are also stored on disk as .npz files
+# and loaded from there after they have been evicted from memory.
+class estimator_cache:
+    def __init__(self,maxsize=8,persist_dir=None):
+        self.maxsize = maxsize
+        self.persist_dir = persist_dir
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+
+    def key(self,kind,code,rmin,rmax):
+        h = hashlib.sha1(numpy.ascontiguousarray(code,dtype=numpy.complex64).tobytes())
+        h.update(("%s %d %d %d"%(kind,len(code),rmin,rmax)).encode())
+        return(h.hexdigest())
+
+    def get(self,key,build):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return(self.entries[key])
+        r = None
+        fname = None
+        if self.persist_dir != None:
+            fname = os.path.join(self.persist_dir,"%s.npz"%(key))
+            if os.path.exists(fname):
+                f = numpy.load(fname)
+                r = dict([(k,f[k]) for k in f.files])
+                f.close()
+        with self.lock:
+            if r == None:
+                self.misses += 1
+            else:
+                self.disk_hits += 1
+        if r == None:
+            r = build()
+            if fname != None:
+                os.makedirs(self.persist_dir,exist_ok=True)
+                tmp = "%s.%d.%d.tmp.npz"%(fname[:-4],os.getpid(),threading.get_ident())
+                numpy.savez(tmp,**r)
+                os.replace(tmp,fname)
+        with self.lock:
+            self.entries[key] = r
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        return(r)
+
+    def stats(self):
+        with self.lock:
+            return({"hits":self.hits,"misses":self.misses,"disk_hits":self.disk_hits,"size":len(self.entries)})
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+estimation_cache = estimator_cache()
 
-    if cache == False or B_cached == False:
-        r_cache = periodic_convolution_matrix(envelope=code,rmin=rmin,rmax=rmax)
-        A = r_cache['A']
+def create_estimation_matrix(code,rmin=0,rmax=1000,cache=True):
+    def build():
+        r = periodic_convolution_matrix(envelope=code,rmin=rmin,rmax=rmax)
+        A = r['A']
         Ah = numpy.transpose(numpy.conjugate(A))
-        B_cache = numpy.dot(numpy.linalg.inv(numpy.dot(Ah,A)),Ah)
-        r_cache['B'] = B_cache
-        B_cached = True
-        return(r_cache)
-    else:
-        return(r_cache)
+        r['B'] = numpy.dot(numpy.linalg.inv(numpy.dot(Ah,A)),Ah)
+        return(r)
+    if cache == False:
+        return(build())
+    return(estimation_cache.get(estimation_cache.key("matrix",code,rmin,rmax),build))
 
 def grid_search1d(fun,xmin,xmax,nstep=100):
     vals = numpy.linspace(xmin,xmax,num=nstep)
@@ -102,35 +238,72 @@ def grid_search1d(fun,xmin,xmax,nstep=100):
             best_idx = i
     return(vals[best_idx])
 
+# least-squares fit of a constant Doppler shift to the phase of one or many echoes.
+# minimizing sum (1/var)|exp(i 2 pi f t) - z/|z||^2 is the same as maximizing
+# P(v) = Re sum (1/var) z/|z| exp(-i 2 pi f t), with f = 2 frad v/c.
+# P is evaluated on the velocity grid with one matrix product per block of grid points, and the
+# best grid point is refined with a parabolic step and a few Newton steps using the analytic derivatives of P.
+#
+# z - echoes [...,n_t], t - times [n_t] or [...,n_t], var - variances (broadcast with z)
+# nstep - number of grid points. by default the grid step is a quarter of the velocity resolution
+#         c/(2 frad T), where T is the length of the time series, but at least 50 points are used.
+# max_elements - size of the block of complex exponentials exp(-i k t v) evaluated at a time
+# returns velocities and powers, with the shape of z without the last axis
+def fit_velocities(z,t,var,frad=440.2e6,vmin=-800.0,vmax=800.0,nstep=None,n_newton=3,max_elements=2**22):
+    z = numpy.asarray(z)
+    t = numpy.asarray(t,dtype=numpy.float64)
+    w = numpy.broadcast_to(1.0/numpy.asarray(var,dtype=numpy.float64),z.shape)
+    wz = w*numpy.exp(1.0j*numpy.angle(z))
+    k = 2.0*constants.pi*2.0*frad/constants.c
+    if nstep == None:
+        T = numpy.max(numpy.ptp(t,axis=-1))
+        nstep = max(50,int(math.ceil(4.0*(vmax-vmin)*2.0*frad*T/constants.c))+1)
+    vals = numpy.linspace(vmin,vmax,num=nstep)
+    P = numpy.empty(numpy.broadcast_shapes(wz.shape[:-1],t.shape[:-1])+(nstep,))
+    chunk = min(nstep,max(1,max_elements//t.size))
+    # exp(-i k t v) in a block starting at grid point v0 is exp(-i k t v0) exp(-i k t (v-v0)),
+    # and the second factor is the same for all blocks
+    S = numpy.exp(-1.0j*k*t[...,None]*(vals[chunk-1]-vals[0])*numpy.linspace(0.0,1.0,num=chunk))
+    for g0 in range(0,nstep,chunk):
+        n_g = min(chunk,nstep-g0)
+        wzb = wz*numpy.exp(-1.0j*k*t*vals[g0])
+        if t.ndim == 1:
+            P[...,g0:(g0+n_g)] = numpy.real(numpy.dot(wzb,S[:,:n_g]))
+        else:
+            P[...,g0:(g0+n_g)] = numpy.real(numpy.matmul(wzb[...,None,:],S[...,:n_g])[...,0,:])
+    best = numpy.argmax(P,axis=-1)
+    v_grid = vals[best]
+    v = v_grid
+    dv = 0.0
+    if nstep > 2:
+        # parabola through the best grid point and its neighbours
+        dv = vals[1]-vals[0]
+        b = numpy.clip(best,1,nstep-2)
+        p0 = numpy.take_along_axis(P,(b-1)[...,None],axis=-1)[...,0]
+        p1 = numpy.take_along_axis(P,b[...,None],axis=-1)[...,0]
+        p2 = numpy.take_along_axis(P,(b+1)[...,None],axis=-1)[...,0]
+        den = p0-2.0*p1+p2
+        ok = (best == b) & (den < 0)
+        v = numpy.where(ok,vals[b]+0.5*dv*(p0-p2)/numpy.where(ok,den,-1.0),v)
+    # Newton steps, kept within one grid step of the best grid point
+    for i in range(n_newton):
+        ph = wz*numpy.exp(-1.0j*k*t*v[...,None])
+        d1 = numpy.real(numpy.sum(ph*(-1.0j*k*t),axis=-1))
+        d2 = numpy.real(numpy.sum(ph*(-(k*t)**2.0),axis=-1))
+        ok = d2 < 0
+        v = numpy.where(ok,v-d1/numpy.where(ok,d2,-1.0),v)
+        v = numpy.clip(v,v_grid-dv,v_grid+dv)
+    dc = numpy.real(numpy.exp(-1.0j*k*t*v[...,None])*z)
+    p = numpy.sum(w*dc,axis=-1)/numpy.sum(w,axis=-1)
+    return(v,p)
+
 def fit_velocity(z,t,var,frad=440.2e6):
-    zz = numpy.exp(1.0j*numpy.angle(z))
-    def ssfun(x):
-        freq = 2.0*frad*x/scipy.constants.c
-        model = numpy.exp(1.0j*2.0*scipy.constants.pi*freq*t)
-        ss = numpy.sum((1.0/var)*numpy.abs(model-zz)**2.0)
-        #        plt.plot( numpy.real(model))
-        #plt.plot( numpy.real(zz), 'red')
-        #plt.show()
-        return(ss)
-    v0 = grid_search1d(ssfun,-800.0,800.0,nstep=50)
-
-    #    v = scipy.optimize.fmin(ssfun,numpy.array([v0]),full_output=False,disp=False,retall=False)
-    return(v0)
+    v,p = fit_velocities(z,t,var,frad=frad)
+    return(float(v))
 
 def fit_velocity_and_power(z,t,var,frad=440.2e6):
-    zz = numpy.exp(1.0j*numpy.angle(z))
-    def ssfun(x):
-        freq = 2.0*frad*x/scipy.constants.c
-        model = numpy.exp(1.0j*2.0*scipy.constants.pi*freq*t)
-        ss = numpy.sum((1.0/var)*numpy.abs(model-zz)**2.0)
-        return(ss)
-    v0 = grid_search1d(ssfun,-800.0,800.0,nstep=50)
-    v0 = scipy.optimize.fmin(ssfun,numpy.array([v0]),full_output=False,disp=False,retall=False)
-    freq = 2.0*frad*v0/scipy.constants.c
-    dc = numpy.real(numpy.exp(-1.0j*2.0*scipy.constants.pi*freq*t)*z)
-    p0 = (1.0/numpy.sum(1.0/var))*numpy.sum((1.0/var)*dc)
-
-    return([v0,p0])
+    v,p = fit_velocities(z,t,var,frad=frad)
+    return([float(v),float(p)])
 
 def dict2hdf5(d,fname):
     f = h5py.File(fname,'w')
@@ -193,11 +366,7 @@ def comprz(x):
 
 def rep(x,n):
     """ interpolate """
-    z = numpy.zeros(len(x)*n)
-    for i in range(len(x)):
-        for j in range(n):
-            z[i*n+j]=x[i]
-    return(z)
+    return(numpy.repeat(x,n))
 
 def comprz_dB(xx,fr=0.05):
     """ Compress signal in such a way that is logarithmic but also avoids negative values """
@@ -213,63 +382,70 @@ def comprz_dB(xx,fr=0.05):
     xx = xx.reshape(sh)
     return(10.0*numpy.log10(xx))
 
-def decimate(x,dec):
-    Nout = int(math.floor(len(x)/dec))
-    idx = numpy.arange(Nout,dtype=numpy.int)*int(dec)
-    res = numpy.zeros(len(idx),dtype=x.dtype)
+def _nanmean(x,axis):
+    """ mean of the non-NaN values, zero if all values are NaN """
+    valid = numpy.logical_not(numpy.isnan(x))
+    count = numpy.sum(valid,axis=axis)
+    res = numpy.sum(numpy.where(valid,x,0.0),axis=axis)
+    return(res/numpy.maximum(count,1))
+
+decimation_ops = {"mean":numpy.mean,
+                  "sum":numpy.sum,
+                  "nanmean":_nanmean,
+                  "max":numpy.max,
+                  "min":numpy.min,
+                  "median":numpy.median}
+
+def decimate_axis(x,dec=10,axis=0,op="mean",chunk=None):
+    """
+    Decimate along an axis by reducing blocks of dec consecutive samples with op
+    (mean, sum, nanmean, max, min, median, or a function taking an axis argument).
+    Samples that do not fill a whole block at the end are dropped.
+
+    chunk - number of output samples processed at a time. x can then be anything
+            that supports slicing (numpy.memmap, h5py dataset) and only dec*chunk
+            input samples along the axis are read into memory at once.
+    """
+    fun = decimation_ops.get(op,op)
+    axis = axis % len(x.shape)
+    Nout = int(x.shape[axis]//dec)
+    if chunk == None:
+        chunk = max(Nout,1)
+    res = None
+    for i0 in range(0,Nout,chunk):
+        i1 = min(i0+chunk,Nout)
+        sl = [slice(None)]*len(x.shape)
+        sl[axis] = slice(i0*dec,i1*dec)
+        xb = numpy.asarray(x[tuple(sl)])
+        xb = xb.reshape(xb.shape[:axis] + (i1-i0,dec) + xb.shape[(axis+1):])
+        rb = fun(xb,axis=axis+1)
+        if res is None:
+            res = numpy.zeros(x.shape[:axis] + (Nout,) + x.shape[(axis+1):],dtype=rb.dtype)
+        sl[axis] = slice(i0,i1)
+        res[tuple(sl)] = rb
+    if res is None:
+        res = numpy.zeros(x.shape[:axis] + (0,) + x.shape[(axis+1):],dtype=x.dtype)
+    return(res)
 
-    for i in numpy.arange(dec):
-        res += x[idx+i]
-    return(res/float(dec))
+def decimate(x,dec):
+    return(decimate_axis(x,dec=int(dec),op="mean"))
 
 def decimate2(x,dec=2):
-    Nout = int(math.floor(len(x)/dec))
-    idx = numpy.arange(Nout,dtype=numpy.int)*int(dec)
-    res = x[idx]*0.0
-    count = numpy.copy(x[idx])
-    count[:]=1.0
-
-    count_vector = numpy.negative(numpy.isnan(x))*1.0
-    x[numpy.where(numpy.isnan(x))] = 0.0
-
-    for i in numpy.arange(dec):
-        res = res + x[idx+i]
-        count += count_vector[idx+i]
-
-    count[numpy.where(count == 0.0)] = 1.0
-    return(res/count)
-
+    """ decimation by averaging, ignoring NaN values """
+    return(decimate_axis(x,dec=int(dec),op="nanmean"))
 
 def median_dec(x,dec=10):
-    Nout = int(math.floor(len(x)/dec))
-    idx = numpy.arange(dec)
-    res = numpy.zeros([Nout],dtype=x.dtype)
-    for i in numpy.arange(Nout):
-        res[i] = numpy.median(x[i*dec + idx])
-    return(res)
+    return(decimate_axis(x,dec=int(dec),op="median"))
 
 def decimate_mat(M,dec0=10,dec1=10):
-    shape2 = [math.floor(M.shape[0]/dec0),math.floor(M.shape[1]/dec1)]
-    M2 = numpy.zeros(shape2,dtype=M.dtype)
-    for i in numpy.arange(shape2[0]):
-        for j in numpy.arange(dec0):
-            M2[i,:] = M2[i,:] + decimate(M[i+j,:],dec=dec1)
-    return(M2)
+    """ sum of dec0 rows and mean of dec1 columns """
+    return(dec0*decimate_axis(decimate_axis(M,dec=int(dec1),axis=1,op="mean"),dec=int(dec0),axis=0,op="mean"))
 
 def decimate_mat_max(M,dec0=10):
-    shape2 = [int(numpy.floor(M.shape[0]/dec0)),int(M.shape[1])]
-    M2 = numpy.zeros(shape2,dtype=M.dtype)
-    idx = numpy.arange(dec0,dtype=numpy.int)
-    for i in range(shape2[0]):
-        for j in range(shape2[1]):
-            M2[i,j] = numpy.max(M[i*dec0 + idx,j])
-    return(M2)
+    return(decimate_axis(M,dec=int(dec0),axis=0,op="max"))
 
 def decimate_max(v,dec=10):
-    v2=numpy.zeros(len(v)/dec)
-    for i in range(len(v2)):
-        v2[i] = numpy.max(v[(i*dec):((i+1)*dec)])
-    return(v2)
+    return(decimate_axis(v,dec=int(dec),op="max"))
 
 
 def plot_cts(x,plot_abs=False,plot_show=True):
@@ -284,14 +460,55 @@ def plot_cts(x,plot_abs=False,plot_show=True):
 
 def hanning(L=1000):
     n = numpy.linspace(0.0,L-1,num=L)
-    return(0.5*(1.0-numpy.cos(2.0*scipy.constants.pi*n/L)))
-
-def spectrogram(x,window=1024,wf=hanning):
-    wfv = wf(L=window)
-    Nwindow = int(math.floor(len(x)/window))
-    res = numpy.zeros([Nwindow,window])
-    for i in range(Nwindow):
-        res[i,] = numpy.abs(numpy.fft.fftshift(numpy.fft.fft(wfv*x[i*window + numpy.arange(window)])))**2
-    return(res)
-
-
+    return(0.5*(1.0-numpy.cos(2.0*constants.pi*n/L)))
+
+# window functions are computed once per function and length, in double precision
+@functools.lru_cache(maxsize=32)
+def window_function(wf=hanning,L=1000):
+    w = numpy.array(wf(L=L),dtype=numpy.float64)
+    w.setflags(write=False)
+    return(w)
+
+def _spectra(x,window,step,wfv,dtype):
+    # all windows of x as a strided view, one batched FFT
+    v = numpy.lib.stride_tricks.sliding_window_view(x,window)[::step]
+    return(numpy.array(numpy.abs(numpy.fft.fftshift(numpy.fft.fft(v*wfv,axis=1),axes=1))**2,dtype=dtype))
+
+def spectrogram_stream(chunks,window=1024,wf=hanning,overlap=0,dtype=numpy.float32,max_rows=256):
+    """
+    Spectrogram of a signal given as a sequence of chunks (list, generator, ...),
+    one block of at most max_rows power spectra [n_rows,window] at a time.
+    Consecutive windows start window-overlap samples apart.
+    Only the samples of the current chunk and the tail of the previous one are kept in memory.
+    """
+    step = window-overlap
+    if step < 1:
+        raise ValueError("overlap must be smaller than window")
+    # single precision output uses a single precision window, so the FFTs are single precision too
+    wfv = numpy.asarray(window_function(wf,window),dtype=numpy.promote_types(dtype,numpy.float32))
+    buf = None
+    for chunk in chunks:
+        if buf is None or len(buf) == 0:
+            buf = numpy.asarray(chunk)
+        else:
+            buf = numpy.concatenate([buf,chunk])
+        if len(buf) < window:
+            continue
+        n_rows = (len(buf)-window)//step + 1
+        for r0 in range(0,n_rows,max_rows):
+            r1 = min(r0+max_rows,n_rows)
+            yield(_spectra(buf[(r0*step):((r1-1)*step+window)],window,step,wfv,dtype))
+        buf = buf[(n_rows*step):]
+
+def spectrogram(x,window=1024,wf=hanning,overlap=0,dtype=numpy.float64,max_rows=256):
+    """
+    Power spectra of consecutive windows of x (fftshifted), [n_windows,window].
+    x can be a numpy.memmap, it is read in blocks of max_rows windows.
+    """
+    step = window-overlap
+    n_chunk = max_rows*step
+    chunks = (x[i:(i+n_chunk)] for i in range(0,len(x),n_chunk))
+    rows = list(spectrogram_stream(chunks,window=window,wf=wf,overlap=overlap,dtype=dtype,max_rows=max_rows))
+    if len(rows) == 0:
+        return(numpy.zeros([0,window],dtype=dtype))
+    return(numpy.concatenate(rows))